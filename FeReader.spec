@@ -6,7 +6,8 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=[],
-    hiddenimports=[],
+    # Imported lazily (module.LazyModule), so the analysis cannot see them.
+    hiddenimports=['fitz', 'pymupdf', 'bs4', 'numpy'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
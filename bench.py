@@ -0,0 +1,327 @@
+"""Headless benchmarks for RenderEngine and ConverterLogic.
+
+    python -m bench -o results.json
+    python -m bench --save-baseline baseline.json
+    python -m bench --baseline baseline.json --threshold 0.25
+    python -m bench --imports
+
+A synthetic corpus (text-, vector- and image-heavy PDFs, a large EPUB,
+a big text file and a folder of scans) is generated once and reused.
+Every case runs in a fresh process under offscreen Qt; its RSS is how
+far resident memory peaks above where it stood when the case started.
+Wall time is the median of --repeat runs; Python allocations are
+measured on one extra run under tracemalloc. With --baseline, cases
+slower or bigger than the threshold allows are reported and the exit
+status is 1. --imports prints the slowest imports of a cold start and
+the time until the main window is up.
+"""
+import sys
+import os
+import json
+import time
+import random
+import platform
+import argparse
+import statistics
+import tempfile
+import subprocess
+import tracemalloc
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import fitz
+
+import module
+import perf
+
+CORPUS_VERSION = 2
+CORPUS_DIR = os.path.join(tempfile.gettempdir(), "fereader_bench")
+ZOOMS = (1.0, 2.0, 4.0)
+PAGES_PER_RUN = 4
+# Differences below these are noise, whatever the threshold says.
+NOISE_FLOOR = {"wall_ms": 2.0, "peak_rss_mb": 2.0, "alloc_peak_mb": 1.0}
+# A cold start: fresh interpreter, imports, main window shown once.
+STARTUP_PROBE = (
+    "import time\n"
+    "start = time.perf_counter()\n"
+    "import main\n"
+    "from PySide6.QtWidgets import QApplication\n"
+    "app = QApplication([])\n"
+    "window = main.FeReaderWindow()\n"
+    "window.show()\n"
+    "app.processEvents()\n"
+    "print((time.perf_counter() - start) * 1000)\n"
+)
+LOREM = ("Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor "
+         "incididunt ut labore et dolore magna aliqua. Ut enim ad minim veniam, quis nostrud "
+         "exercitation ullamco laboris nisi ut aliquip ex ea commodo consequat.")
+
+def _write_text(path, megabytes):
+    with open(path, "w", encoding="utf-8") as f:
+        chapter = 0
+        while f.tell() < megabytes * 1024 * 1024:
+            f.write(f"Chapter {chapter}\n\n")
+            for _ in range(200):
+                f.write(LOREM + "\n")
+            chapter += 1
+
+def _noise_pixmap(rng, width, height):
+    # Smooth-ish noise: compresses like a photo rather than like a flat fill.
+    row = bytes(rng.randrange(256) for _ in range(width * 3))
+    shifts = [rng.randrange(width * 3) for _ in range(height)]
+    samples = b"".join(row[s:] + row[:s] for s in shifts)
+    return fitz.Pixmap(fitz.csRGB, width, height, samples, False)
+
+def _make_vector_pdf(path, pages, rng):
+    doc = fitz.open()
+    for _ in range(pages):
+        page = doc.new_page()
+        shape = page.new_shape()
+        # Many small paths, like a plotted chart or a CAD drawing.
+        for _ in range(1500):
+            p1 = fitz.Point(rng.uniform(0, 595), rng.uniform(0, 842))
+            p2 = p1 + (rng.uniform(-60, 60), rng.uniform(-60, 60))
+            shape.draw_bezier(p1, p1 + (20, 0), p2 - (20, 0), p2)
+            shape.finish(color=(rng.random(), 0, 0), width=0.5)
+        for _ in range(200):
+            x, y = rng.uniform(0, 560), rng.uniform(0, 810)
+            shape.draw_rect(fitz.Rect(x, y, x + 30, y + 20))
+            shape.finish(color=(0, 0, 1), fill=(0.9, 0.9, 1), fill_opacity=0.5)
+        shape.commit()
+    doc.save(path, deflate=True)
+    doc.close()
+
+def _make_image_pdf(path, pages, rng):
+    doc = fitz.open()
+    for _ in range(pages):
+        page = doc.new_page()
+        for top in (40, 440):
+            page.insert_image(fitz.Rect(40, top, 555, top + 380), pixmap=_noise_pixmap(rng, 1200, 900))
+    doc.save(path, deflate=True)
+    doc.close()
+
+def make_corpus(directory, scale=1):
+    """Generate the corpus into `directory` unless it is already there."""
+    directory = os.path.join(directory, f"v{CORPUS_VERSION}_s{scale}")
+    done = os.path.join(directory, "complete")
+    if os.path.exists(done):
+        return directory
+    os.makedirs(os.path.join(directory, "scans"), exist_ok=True)
+    rng = random.Random(42)
+    _write_text(os.path.join(directory, "small.txt"), 1 * scale)
+    _write_text(os.path.join(directory, "big.txt"), 5 * scale)
+    module.ConverterLogic.text_to_pdf(os.path.join(directory, "small.txt"), os.path.join(directory, "text.pdf"))
+    module.ConverterLogic.text_to_epub(os.path.join(directory, "big.txt"), os.path.join(directory, "large.epub"),
+                                       chapter_bytes=64 * 1024)
+    _make_vector_pdf(os.path.join(directory, "vector.pdf"), 20 * scale, rng)
+    _make_image_pdf(os.path.join(directory, "image.pdf"), 20 * scale, rng)
+    for i in range(20 * scale):
+        _noise_pixmap(rng, 1240, 1754).save(os.path.join(directory, "scans", f"{i:04}.png"))
+    open(done, "w").close()
+    return directory
+
+def _render_case(path, method, zoom, pages=PAGES_PER_RUN, night=False):
+    import render
+    engine = render.RenderEngine()
+    engine.load_pdf(path)
+    engine.set_night_mode(night)
+    step = 2 if method == "get_pdf_spread_pixmap" else 1
+    indices = range(0, min(pages * step, engine.pdf_doc.page_count), step)
+    def run():
+        # Cold pages every run: nothing rendered or interpreted is kept.
+        engine.page_cache.clear()
+        engine.display_lists.clear()
+        for index in indices:
+            getattr(engine, method)(index, zoom)
+    return run
+
+def _load_case(path, method):
+    import render
+    engine = render.RenderEngine()
+    return lambda: getattr(engine, method)(path)
+
+def _initial_zoom_case(path):
+    import render
+    engine = render.RenderEngine()
+    engine.load_pdf(path)
+    return lambda: engine.get_initial_zoom(1280, 900)
+
+def _convert_case(method, source, output, **kwargs):
+    return lambda: getattr(module.ConverterLogic, method)(source, output, **kwargs)
+
+def _launch(importtime=False):
+    env = dict(os.environ, QT_QPA_PLATFORM="offscreen")
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", STARTUP_PROBE]
+    return subprocess.run(command, cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+                          capture_output=True, text=True, check=True)
+
+def import_profile(top=20):
+    """Return ms to first window and the `top` slowest imports as
+    (cumulative ms, self ms, name), name indented by nesting depth."""
+    result = _launch(importtime=True)
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        if own.strip().isdigit():
+            imports.append((int(cumulative) / 1000, int(own) / 1000, name.rstrip()[1:]))
+    imports.sort(reverse=True)
+    return float(result.stdout.split()[-1]), imports[:top]
+
+def cases(corpus):
+    """Name -> factory returning the callable to time; setup is not timed."""
+    pdfs = {kind: os.path.join(corpus, f"{kind}.pdf") for kind in ("text", "vector", "image")}
+    epub = os.path.join(corpus, "large.epub")
+    out = os.path.join(corpus, "out")
+    scans = sorted(os.path.join(corpus, "scans", name) for name in os.listdir(os.path.join(corpus, "scans")))
+    table = {}
+    for kind, path in pdfs.items():
+        table[f"load_pdf[{kind}]"] = lambda path=path: _load_case(path, "load_pdf")
+        for zoom in ZOOMS:
+            table[f"page_pixmap[{kind},{zoom:g}x]"] = (
+                lambda path=path, zoom=zoom: _render_case(path, "get_pdf_page_pixmap", zoom))
+        table[f"spread_pixmap[{kind}]"] = lambda path=path: _render_case(path, "get_pdf_spread_pixmap", 1.0)
+        table[f"page_pixmap[{kind},2x,night]"] = (
+            lambda path=path: _render_case(path, "get_pdf_page_pixmap", 2.0, night=True))
+    table["load_epub[large]"] = lambda: _load_case(epub, "load_epub")
+    table["initial_zoom"] = lambda: _initial_zoom_case(pdfs["text"])
+    table["text_to_pdf"] = lambda: _convert_case("text_to_pdf", os.path.join(corpus, "big.txt"), out + ".pdf")
+    table["text_to_epub"] = lambda: _convert_case("text_to_epub", os.path.join(corpus, "big.txt"), out + ".epub")
+    table["images_to_pdf"] = lambda: _convert_case("images_to_pdf", scans, out + ".pdf", workers=1)
+    table["images_to_pdf[bilevel]"] = lambda: _convert_case("images_to_pdf", scans, out + ".pdf",
+                                                            bilevel=True, workers=1)
+    table["pdf_to_text"] = lambda: _convert_case("pdf_to_text", pdfs["text"], out + ".txt", workers=1)
+    table["pdf_to_markdown"] = lambda: _convert_case("pdf_to_text", pdfs["text"], out + ".md",
+                                                     markdown=True, workers=1)
+    table["epub_to_text"] = lambda: _convert_case("epub_to_text", epub, out + ".txt", workers=1)
+    # Runs in its own interpreter, so only the wall time is the app's.
+    table["startup"] = lambda: _launch
+    return table
+
+def _reset_peak_rss():
+    """Restart the peak RSS count from here where the OS allows (Linux);
+    returns the resident MB at this point."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+    return perf.rss_mb()
+
+def _peak_rss_mb():
+    """Peak resident memory of this process in MB, or None if unknown."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        # Windows: psutil knows the peak working set, if it is installed.
+        try:
+            import psutil
+        except ImportError:
+            return None
+        return psutil.Process().memory_info().peak_wset / 2 ** 20
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (2 ** 20 if sys.platform == "darwin" else 1024)
+
+def run_case(corpus, name, repeat):
+    """Run one case in this (fresh) process and return its measurements."""
+    from PySide6.QtGui import QGuiApplication
+    app = QGuiApplication.instance() or QGuiApplication([])
+    run = cases(corpus)[name]()
+    # A spawned child inherits its parent's high-water mark, so count from here.
+    rss_start = _reset_peak_rss()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        times.append((time.perf_counter() - start) * 1000)
+    rss_peak = _peak_rss_mb()
+    tracemalloc.start()
+    run()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"wall_ms": statistics.median(times), "min_ms": min(times), "runs": repeat,
+            "peak_rss_mb": max(0.0, rss_peak - rss_start) if rss_peak and rss_start else None,
+            "alloc_peak_mb": peak / 2 ** 20}
+
+def compare(results, baseline, threshold):
+    """Return the cases that got slower or bigger than the threshold allows."""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        for metric, floor in NOISE_FLOOR.items():
+            old, new = base.get(metric), result.get(metric)
+            if old and new and new > old * (1 + threshold) and new - old > floor:
+                regressions.append((name, metric, old, new))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bench", description="Benchmark FeReader's render and convert paths.")
+    parser.add_argument("-o", "--output", help="write results as JSON here")
+    parser.add_argument("-k", "--filter", default="", help="only run cases whose name contains this")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per case")
+    parser.add_argument("--scale", type=int, default=1, help="corpus size multiplier")
+    parser.add_argument("--corpus-dir", default=CORPUS_DIR, help="where the synthetic corpus is kept")
+    parser.add_argument("--baseline", help="compare against this results file")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown/growth, as a fraction")
+    parser.add_argument("--save-baseline", help="also write the results here, as the new baseline")
+    parser.add_argument("--imports", action="store_true", help="profile the imports of a cold start and exit")
+    args = parser.parse_args(argv)
+
+    if args.imports:
+        window_ms, imports = import_profile()
+        print(f"{'cumulative':>10} {'self':>8}  module")
+        for cumulative, own, name in imports:
+            print(f"{cumulative:8.1f}ms {own:6.1f}ms  {name}")
+        print(f"main window shown after {window_ms:.0f} ms (interpreter start not included)")
+        return 0
+
+    corpus = make_corpus(args.corpus_dir, args.scale)
+    names = [name for name in cases(corpus) if args.filter in name]
+    results = {}
+    for name in names:
+        # A fresh, spawned process per case keeps peak RSS and caches independent.
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            try:
+                results[name] = pool.submit(run_case, corpus, name, max(1, args.repeat)).result()
+            except Exception as e:
+                print(f"{name:32} Error: {e}", flush=True)
+                continue
+        r = results[name]
+        rss = f"{r['peak_rss_mb']:8.1f}" if r["peak_rss_mb"] is not None else "     n/a"
+        print(f"{name:32} {r['wall_ms']:10.1f} ms  rss {rss} MB  alloc {r['alloc_peak_mb']:7.1f} MB", flush=True)
+
+    report = {
+        "meta": {"python": platform.python_version(), "pymupdf": fitz.VersionBind, "platform": platform.platform(),
+                 "cpus": os.cpu_count(), "scale": args.scale, "repeat": args.repeat, "time": time.time()},
+        "results": results,
+    }
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        for name, metric, old, new in regressions:
+            print(f"REGRESSION {name} {metric}: {old:.1f} -> {new:.1f} (+{(new / old - 1) * 100:.0f}%)")
+        print(f"{len(regressions)} regression(s) against {args.baseline}")
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,174 @@
+"""Batch conversion without the UI.
+
+    python -m convert text_pdf notes/*.txt dumps/ -o out/ -j 8
+    python -m convert images_pdf scans/ -o out/
+    python -m convert pdf_md library/ -o text/
+
+images_pdf turns every directory that holds images into one PDF; the
+other modes convert every matching file found. Outputs newer than their
+sources are skipped unless --force is given. A single job of a mode that
+parallelises internally spreads its pages across the -j workers instead.
+"""
+import sys
+import os
+import glob
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+import module
+
+TEXT_EXTENSIONS = (".txt",)
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp")
+MODES = {
+    "text_pdf": (TEXT_EXTENSIONS, ".pdf"),
+    "text_epub": (TEXT_EXTENSIONS, ".epub"),
+    "images_pdf": (IMAGE_EXTENSIONS, ".pdf"),
+    "pdf_txt": ((".pdf",), ".txt"),
+    "pdf_md": ((".pdf",), ".md"),
+    "epub_txt": ((".epub",), ".txt"),
+}
+# Modes that split one input across their own worker processes.
+PARALLEL_MODES = ("images_pdf", "pdf_txt", "pdf_md", "epub_txt")
+
+def _glob_root(pattern):
+    """The directory a pattern's wildcards start below."""
+    while glob.has_magic(pattern):
+        pattern = os.path.dirname(pattern)
+    return pattern
+
+def _expand(patterns):
+    """Yield (path, root) for every file or directory the patterns name.
+    Globbed matches keep their path below the pattern's fixed prefix."""
+    for pattern in patterns:
+        matches = glob.glob(pattern, recursive=True)
+        root = _glob_root(pattern) if matches and glob.has_magic(pattern) else None
+        for path in sorted(matches or [pattern]):
+            path = os.path.normpath(path)
+            if os.path.isdir(path):
+                yield path, os.path.normpath(path if root is None else root)
+            elif os.path.isfile(path):
+                yield path, os.path.normpath(os.path.dirname(path) if root is None else root)
+            else:
+                print(f"Not found: {path}", file=sys.stderr)
+
+def plan_jobs(mode, patterns, output_dir=None):
+    """Return (sources, output) pairs; outputs mirror the input tree. Only
+    images_pdf takes several sources; other jobs with more than one are
+    inputs that would overwrite each other's output."""
+    extensions, out_ext = MODES[mode]
+    groups = {}
+    # "dir/**" names a directory and everything under it, so a file can turn up more than once.
+    seen = set()
+    for path, root in _expand(patterns):
+        if os.path.isdir(path):
+            walked = (os.path.join(d, f) for d, _, files in os.walk(path) for f in files)
+        else:
+            walked = [path]
+        for file_path in walked:
+            if not file_path.lower().endswith(extensions):
+                continue
+            real = os.path.realpath(file_path)
+            if real in seen:
+                continue
+            seen.add(real)
+            if mode == "images_pdf":
+                # One PDF per directory of images, named after the directory.
+                target = os.path.dirname(file_path)
+                # realpath: "." has no useful name of its own.
+                name = os.path.basename(os.path.realpath(root))
+                rel = os.path.normpath(os.path.join(name, os.path.relpath(target, root)))
+            else:
+                target = os.path.splitext(file_path)[0]
+                rel = os.path.splitext(os.path.relpath(file_path, root))[0]
+            output = os.path.join(output_dir, rel) if output_dir else target
+            groups.setdefault(output + out_ext, []).append(file_path)
+    return [(sorted(sources), output) for output, sources in groups.items()]
+
+def is_up_to_date(sources, output):
+    if not os.path.exists(output):
+        return False
+    newest = max(os.path.getmtime(s) for s in sources)
+    return os.path.getmtime(output) >= newest
+
+def run_job(mode, sources, output, password=None, layout=None, images=None, workers=1):
+    """Convert one job in a worker process; returns seconds spent and a note."""
+    start = time.perf_counter()
+    note = ""
+    out_dir = os.path.dirname(output)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    try:
+        if mode == "text_pdf":
+            stats = module.ConverterLogic.text_to_pdf(sources[0], output, password, **(layout or {}))
+            note = f"{stats['pages']} pages, {stats['pages_per_sec']:.0f} pages/s"
+        elif mode == "text_epub":
+            stats = module.ConverterLogic.text_to_epub(sources[0], output)
+            note = f"{stats['chapters']} chapters"
+        elif mode == "images_pdf":
+            stats = module.ConverterLogic.images_to_pdf(sources, output, password, workers=workers, **(images or {}))
+            note = f"{stats['images']} images, {stats['images_per_sec']:.1f} images/s"
+        elif mode in ("pdf_txt", "pdf_md"):
+            stats = module.ConverterLogic.pdf_to_text(sources[0], output, mode == "pdf_md", workers)
+            note = f"{stats['pages']} pages, {stats['pages_per_sec']:.0f} pages/s"
+        elif mode == "epub_txt":
+            stats = module.ConverterLogic.epub_to_text(sources[0], output, workers)
+            note = f"{stats['chapters']} chapters"
+    except Exception as e:
+        # MuPDF exceptions do not pickle back to the parent process.
+        raise RuntimeError(f"{type(e).__name__}: {e}") from None
+    return time.perf_counter() - start, note
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m convert", description="Batch-convert files with FeReader.")
+    parser.add_argument("mode", choices=sorted(MODES))
+    parser.add_argument("inputs", nargs="+", help="files, directories or glob patterns")
+    parser.add_argument("-o", "--output-dir", help="write outputs here instead of next to the inputs")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="worker processes")
+    parser.add_argument("--password", help="encrypt PDF outputs")
+    parser.add_argument("--force", action="store_true", help="convert even if the output is up to date")
+    parser.add_argument("--font", choices=sorted(module.TextPdfWriter.BASE14), help="base-14 font for text_pdf")
+    parser.add_argument("--font-file", help="TrueType/OpenType font to embed for text_pdf")
+    parser.add_argument("--font-size", type=float, help="font size in points for text_pdf")
+    parser.add_argument("--dpi", type=int, help="downscale images above this resolution for images_pdf")
+    parser.add_argument("--jpeg-quality", type=int, help="re-encode images as JPEG (1-100) for images_pdf")
+    parser.add_argument("--bilevel", action="store_true", help="store images as 1-bit black and white for images_pdf")
+    args = parser.parse_args(argv)
+    layout = {key: value for key, value in (("font", args.font), ("font_file", args.font_file),
+                                            ("font_size", args.font_size)) if value is not None}
+    images = {"dpi": args.dpi, "jpeg_quality": args.jpeg_quality, "bilevel": args.bilevel}
+
+    jobs = plan_jobs(args.mode, args.inputs, args.output_dir)
+    clashes = [(s, o) for s, o in jobs if len(s) > 1 and args.mode != "images_pdf"]
+    for sources, output in clashes:
+        print(f"FAIL            {output}: written by {len(sources)} inputs ({', '.join(sources)})")
+    jobs = [job for job in jobs if job not in clashes]
+    todo = [(s, o) for s, o in jobs if args.force or not is_up_to_date(s, o)]
+    skipped = len(jobs) - len(todo)
+    failed = 0
+    start = time.perf_counter()
+    workers = 1
+    if len(todo) == 1 and args.mode in PARALLEL_MODES:
+        # One job: spread its pages over the workers instead of nesting pools.
+        workers = max(1, args.jobs)
+        pool = ThreadPoolExecutor(max_workers=1)
+    else:
+        pool = ProcessPoolExecutor(max_workers=max(1, args.jobs))
+    with pool:
+        futures = {pool.submit(run_job, args.mode, s, o, args.password, layout, images, workers): o for s, o in todo}
+        for future in as_completed(futures):
+            output = futures[future]
+            try:
+                seconds, note = future.result()
+                print(f"ok    {seconds:7.2f}s  {output}" + (f"  ({note})" if note else ""))
+            except Exception as e:
+                failed += 1
+                print(f"FAIL            {output}: {e}")
+    total = time.perf_counter() - start
+    print(f"{len(todo) - failed} converted, {skipped} up to date, {failed + len(clashes)} failed in {total:.2f}s")
+    return 1 if failed or clashes else 0
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
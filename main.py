@@ -1,19 +1,32 @@
+import time
+_STARTED = time.perf_counter()
+
 import sys
 import os
 import json
+import bisect
+import posixpath
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
 from PySide6.QtWidgets import (
     QApplication, QMainWindow, QTextBrowser, QFileDialog, QToolBar,
     QMessageBox, QStatusBar, QInputDialog, QLabel, QScrollArea,
     QStackedWidget, QVBoxLayout, QWidget, QLineEdit, QDialog,
-    QComboBox, QSpinBox, QPushButton, QHBoxLayout, QCheckBox, QToolButton, QMenu
+    QComboBox, QSpinBox, QPushButton, QHBoxLayout, QCheckBox, QToolButton, QMenu,
+    QProgressBar, QDockWidget, QListWidget, QListWidgetItem
 )
 from PySide6.QtGui import (
-    QFont, QFontDatabase, QKeySequence, QAction
+    QFontDatabase, QKeySequence, QAction, QPainter, QPixmap, QColor, QPalette,
+    QAbstractTextDocumentLayout, QTextCursor, QTextCharFormat, QDesktopServices
+)
+from PySide6.QtCore import (
+    Qt, Signal, QSettings, QThread, QObject, QTimer, QRectF, QRect, QPointF, QUrl
 )
-from PySide6.QtCore import Qt, Signal, QSettings
 
 import module
+import perf
 import render
+import search
 
 class PageScrollArea(QScrollArea):
     def __init__(self, parent=None):
@@ -35,6 +48,206 @@ class PageScrollArea(QScrollArea):
                 return
         super().wheelEvent(event)
 
+class RenderScheduler(QObject):
+    """Sits between the window and RenderEngine for page and spread renders.
+
+    Bursts of requests collapse into the latest target, renders run on the
+    engine's worker pool, and a render that has been superseded is aborted
+    and never shown.
+    """
+    image_ready = Signal(object, object)
+    _finished = Signal(object, object)
+    COALESCE_MS = 15
+
+    def __init__(self, renderer, parent=None):
+        super().__init__(parent)
+        self.renderer = renderer
+        self._latest = None
+        self._pending = None
+        self._in_flight = None
+        # Set once the in-flight job has been told to stop; it will come back empty.
+        self._aborted = False
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(self.COALESCE_MS)
+        self._timer.timeout.connect(self._dispatch)
+        self._finished.connect(self._on_finished)
+
+    def request(self, index, zoom, spread=False):
+        """Ask for a render; returns True if it was served from the cache."""
+        target = (index, zoom, spread)
+        self._latest = target
+        img = self.renderer.get_cached_image(index, zoom, spread)
+        if img is not None:
+            self._pending = None
+            self._abort()
+            self.image_ready.emit(target, img)
+            return True
+        if self._in_flight == target and not self._aborted:
+            self._pending = None
+            return False
+        if self._in_flight != target:
+            self._abort()
+        self._pending = target
+        self._timer.start()
+        return False
+
+    def cancel(self):
+        self._latest = self._pending = None
+        self._timer.stop()
+        self._abort()
+
+    def _abort(self):
+        if self._in_flight is not None:
+            self.renderer.abort_render()
+            self._aborted = True
+
+    def _dispatch(self):
+        if self._pending is None or self._in_flight is not None:
+            return
+        target, self._pending = self._pending, None
+        img = self.renderer.get_cached_image(*target)
+        if img is not None:
+            self.image_ready.emit(target, img)
+            return
+        self._in_flight = target
+        self._aborted = False
+        job = self.renderer.render_async(*target)
+        job.add_done_callback(lambda f: self._finished.emit(
+            target, None if f.cancelled() or f.exception() else f.result()))
+
+    def _on_finished(self, target, img):
+        aborted, self._in_flight, self._aborted = self._aborted, None, False
+        if img is not None and target == self._latest:
+            self.image_ready.emit(target, img)
+        elif aborted and target == self._latest and self._pending is None:
+            # Aborted after being asked for again: render it once more.
+            self._pending = target
+        if self._pending is not None:
+            self._timer.start()
+
+class TiledPageWidget(QWidget):
+    """Paints a high-zoom PDF page from renderer tiles, only where exposed."""
+    def __init__(self, renderer, parent=None):
+        super().__init__(parent)
+        self.renderer = renderer
+        self.index = 0
+        self.zoom = 1.0
+
+    def set_page(self, index, zoom):
+        self.index, self.zoom = index, zoom
+        self.setFixedSize(*self.renderer.get_pdf_page_size(index, zoom))
+        self.update()
+
+    def paintEvent(self, event):
+        size = render.TILE_SIZE
+        rect = event.rect()
+        cols = range(rect.left() // size, rect.right() // size + 1)
+        rows = range(rect.top() // size, rect.bottom() // size + 1)
+        painter = QPainter(self)
+        painter.fillRect(rect, Qt.black if self.renderer.night_mode else Qt.white)
+        for row in rows:
+            for col in cols:
+                img = self.renderer.get_pdf_tile_image(self.index, self.zoom, col, row)
+                if img is not None:
+                    painter.drawImage(col * size, row * size, img)
+        painter.end()
+
+        # Warm the ring of tiles just outside the exposed area.
+        max_col, max_row = (self.width() - 1) // size, (self.height() - 1) // size
+        ring = [
+            (col, row)
+            for row in range(max(0, rows.start - 1), min(max_row, rows.stop) + 1)
+            for col in range(max(0, cols.start - 1), min(max_col, cols.stop) + 1)
+            if col not in cols or row not in rows
+        ]
+        self.renderer.prefetch_tiles(self.index, self.zoom, ring)
+
+class ContinuousPageWidget(QWidget):
+    """Virtualized "All Pages" view.
+
+    Page slots are laid out from the renderer's page rect table; only pages
+    near the viewport are rendered, and pixmaps of pages that scroll far
+    away are released.
+    """
+    page_rendered = Signal(int)
+    GAP = 10
+    KEEP_PAGES = 4
+
+    def __init__(self, renderer, parent=None):
+        super().__init__(parent)
+        self.renderer = renderer
+        self.zoom = None
+        self._tops = []
+        self._sizes = []
+        self._pixmaps = {}
+        self.page_rendered.connect(self._on_page_rendered)
+
+    def build(self, zoom):
+        self.zoom = zoom
+        self._pixmaps.clear()
+        self._tops, self._sizes = [], []
+        y = 0
+        for rect in self.renderer.get_page_rects():
+            size = (round(rect.width * zoom), round(rect.height * zoom))
+            self._tops.append(y)
+            self._sizes.append(size)
+            y += size[1] + self.GAP
+        width = max((w for w, _ in self._sizes), default=0)
+        self.setFixedSize(width, max(0, y - self.GAP))
+        self.update()
+
+    def page_top(self, index):
+        return self._tops[index] if 0 <= index < len(self._tops) else 0
+
+    def page_at(self, y):
+        return max(0, bisect.bisect_right(self._tops, y) - 1)
+
+    def refresh(self, top, bottom):
+        """Render pages around the visible band and drop far-away pixmaps."""
+        if not self._tops:
+            return
+        first, last = self.page_at(top), self.page_at(bottom)
+        for index in list(self._pixmaps):
+            if index < first - self.KEEP_PAGES or index > last + self.KEEP_PAGES:
+                del self._pixmaps[index]
+        wanted = range(max(0, first - 1), min(len(self._tops), last + 2))
+        jobs = self.renderer.prefetch_pages([i for i in wanted if i not in self._pixmaps], self.zoom)
+        for index, job in jobs.items():
+            job.add_done_callback(lambda _, i=index: self.page_rendered.emit(i))
+
+    def _page_rect(self, index):
+        w, h = self._sizes[index]
+        return (self.width() - w) // 2, self._tops[index], w, h
+
+    def _on_page_rendered(self, index):
+        if index < len(self._tops):
+            self.update(*self._page_rect(index))
+
+    def paintEvent(self, event):
+        if not self._tops:
+            return
+        rect = event.rect()
+        painter = QPainter(self)
+        for index in range(self.page_at(rect.top()), self.page_at(rect.bottom()) + 1):
+            x, y, w, h = self._page_rect(index)
+            pix = self._pixmaps.get(index)
+            if pix is None:
+                img = self.renderer.get_cached_image(index, self.zoom)
+                if img is not None:
+                    pix = self._pixmaps[index] = QPixmap.fromImage(img)
+            if pix is not None:
+                painter.drawPixmap(x, y, pix)
+                continue
+            thumb = self.renderer.get_cached_thumbnail(index)
+            if thumb is not None:
+                painter.drawImage(QRect(x, y, w, h), thumb)
+            else:
+                painter.fillRect(x, y, w, h, Qt.black if self.renderer.night_mode else Qt.white)
+                painter.setPen(Qt.lightGray)
+                painter.drawRect(x, y, w - 1, h - 1)
+        painter.end()
+
 class ClickableLabel(QLabel):
     clicked = Signal()
     def mousePressEvent(self, event):
@@ -42,6 +255,341 @@ class ClickableLabel(QLabel):
             self.clicked.emit()
         super().mousePressEvent(event)
 
+class EpubPageView(QWidget):
+    """Paints one page of a paginated chapter, so a page turn is a repaint.
+
+    Clicking a link emits link_activated with its href; dragging selects
+    text, which Ctrl+C copies. The wheel and the paging keys turn pages
+    through on_scroll_prev/on_scroll_next.
+    """
+    link_activated = Signal(str)
+    selection_changed = Signal()
+    resized = Signal()
+    HIGHLIGHT = QColor(255, 200, 0, 140)
+    NEXT_KEYS = (Qt.Key_PageDown, Qt.Key_Space, Qt.Key_Down, Qt.Key_Right)
+    PREV_KEYS = (Qt.Key_PageUp, Qt.Key_Backspace, Qt.Key_Up, Qt.Key_Left)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.document = None
+        self.page = 0
+        self.page_height = 0
+        self.highlight = None
+        self.selection = None
+        self._select_from = None
+        self.on_scroll_prev = None
+        self.on_scroll_next = None
+        self.setMouseTracking(True)
+        self.setFocusPolicy(Qt.StrongFocus)
+        self.setAttribute(Qt.WA_StyledBackground, True)
+
+    def show_page(self, document, page, page_height, highlight=None):
+        """Show `page` of a laid-out document; `highlight` is a (start, end) offset pair."""
+        if document is not self.document:
+            self._set_selection(None)
+        self.document, self.page, self.page_height, self.highlight = document, page, page_height, highlight
+        self.update()
+
+    def clear(self):
+        self._set_selection(None)
+        self.document = None
+        self.update()
+
+    def selected_text(self):
+        if self.document is None or self.selection is None:
+            return ""
+        cursor = QTextCursor(self.document)
+        cursor.setPosition(self.selection[0])
+        cursor.setPosition(self.selection[1], QTextCursor.KeepAnchor)
+        return cursor.selectedText().replace("\u2029", "\n").replace("\u2028", "\n")
+
+    def copy(self):
+        text = self.selected_text()
+        if text:
+            QApplication.clipboard().setText(text)
+
+    def _set_selection(self, selection):
+        if selection != self.selection:
+            self.selection = selection
+            self.update()
+            self.selection_changed.emit()
+
+    def _doc_point(self, pos):
+        return QPointF(pos.x(), pos.y() + self.page * self.page_height)
+
+    def _anchor_at(self, pos):
+        if self.document is None:
+            return ""
+        return self.document.documentLayout().anchorAt(self._doc_point(pos))
+
+    def _position_at(self, pos):
+        return self.document.documentLayout().hitTest(self._doc_point(pos), Qt.FuzzyHit)
+
+    def paintEvent(self, event):
+        if self.document is None:
+            return
+        with perf.span("paint_page", page=self.page):
+            top = self.page * self.page_height
+            ctx = QAbstractTextDocumentLayout.PaintContext()
+            ctx.clip = QRectF(0, top, self.width(), self.page_height)
+            palette = self.palette()
+            palette.setColor(QPalette.Text, palette.color(self.foregroundRole()))
+            ctx.palette = palette
+            selections = []
+            for span, background, foreground in (
+                    (self.highlight, self.HIGHLIGHT, None),
+                    (self.selection, palette.color(QPalette.Highlight), palette.color(QPalette.HighlightedText))):
+                if not span:
+                    continue
+                cursor = QTextCursor(self.document)
+                cursor.setPosition(span[0])
+                cursor.setPosition(span[1], QTextCursor.KeepAnchor)
+                selection = QAbstractTextDocumentLayout.Selection()
+                selection.cursor = cursor
+                selection.format = QTextCharFormat()
+                selection.format.setBackground(background)
+                if foreground is not None:
+                    selection.format.setForeground(foreground)
+                selections.append(selection)
+            ctx.selections = selections
+            painter = QPainter(self)
+            painter.translate(0, -top)
+            self.document.documentLayout().draw(painter, ctx)
+            painter.end()
+
+    def mousePressEvent(self, event):
+        anchor = self._anchor_at(event.position())
+        if anchor:
+            self.link_activated.emit(anchor)
+            return
+        if event.button() == Qt.LeftButton and self.document is not None:
+            self._select_from = self._position_at(event.position())
+            self._set_selection(None)
+        super().mousePressEvent(event)
+
+    def mouseMoveEvent(self, event):
+        if self._select_from is not None and event.buttons() & Qt.LeftButton:
+            end = self._position_at(event.position())
+            self._set_selection((min(self._select_from, end), max(self._select_from, end))
+                                if end != self._select_from else None)
+            self.setCursor(Qt.IBeamCursor)
+        else:
+            self.setCursor(Qt.PointingHandCursor if self._anchor_at(event.position()) else Qt.ArrowCursor)
+        super().mouseMoveEvent(event)
+
+    def mouseReleaseEvent(self, event):
+        self._select_from = None
+        super().mouseReleaseEvent(event)
+
+    def mouseDoubleClickEvent(self, event):
+        if self.document is None:
+            return
+        cursor = QTextCursor(self.document)
+        cursor.setPosition(self._position_at(event.position()))
+        cursor.select(QTextCursor.WordUnderCursor)
+        if cursor.hasSelection():
+            self._set_selection((cursor.selectionStart(), cursor.selectionEnd()))
+
+    def keyPressEvent(self, event):
+        if event.matches(QKeySequence.Copy):
+            self.copy()
+        elif event.matches(QKeySequence.SelectAll) and self.document is not None:
+            self._set_selection((0, self.document.characterCount() - 1))
+        elif event.key() in self.NEXT_KEYS and self.on_scroll_next:
+            self.on_scroll_next()
+        elif event.key() in self.PREV_KEYS and self.on_scroll_prev:
+            self.on_scroll_prev()
+        else:
+            super().keyPressEvent(event)
+
+    def wheelEvent(self, event):
+        delta = event.angleDelta().y()
+        if delta > 0 and self.on_scroll_prev:
+            self.on_scroll_prev()
+        elif delta < 0 and self.on_scroll_next:
+            self.on_scroll_next()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.resized.emit()
+
+class DocumentLoader(QThread):
+    """Runs RenderEngine.load_pdf/load_epub off the UI thread."""
+    progress = Signal(str, int, int)
+    loaded = Signal()
+    failed = Signal(str)
+    cancelled = Signal()
+    password_needed = Signal()
+
+    def __init__(self, renderer, path, parent=None):
+        super().__init__(parent)
+        self.renderer = renderer
+        self.path = path
+        self.password = None
+        self._cancel_requested = False
+
+    def cancel(self):
+        self._cancel_requested = True
+
+    def is_cancelled(self):
+        return self._cancel_requested
+
+    def _ask_password(self):
+        # Blocks until the UI thread has filled in self.password.
+        self.password_needed.emit()
+        return self.password
+
+    def run(self):
+        ext = os.path.splitext(self.path)[1].lower()
+        try:
+            if ext == ".pdf":
+                self.renderer.load_pdf(self.path, self._ask_password)
+            else:
+                self.renderer.load_epub(self.path, self.progress.emit, self.is_cancelled)
+            self.loaded.emit()
+        except render.LoadCancelled:
+            self.cancelled.emit()
+        except Exception as e:
+            self.failed.emit(str(e))
+
+class SearchIndexer(QThread):
+    """Fills the search index for one book in the background."""
+    progress = Signal(int, int)
+
+    def __init__(self, index, path, parent=None):
+        super().__init__(parent)
+        self.index = index
+        self.path = path
+        self._cancel_requested = False
+
+    def cancel(self):
+        self._cancel_requested = True
+
+    def run(self):
+        try:
+            self.index.index_document(self.path, self.progress.emit, lambda: self._cancel_requested)
+        except Exception as e:
+            print(f"Index Error: {e}")
+
+class SearchPanel(QDockWidget):
+    """Query box and hit list; hits are looked up as the user types, on a
+    worker thread, and only the newest query's hits are shown."""
+    hit_activated = Signal(object, str)
+    _finished = Signal(int, object, object)
+    QUERY_DELAY_MS = 150
+
+    def __init__(self, index, title, all_books_text, parent=None):
+        super().__init__(title, parent)
+        self.index = index
+        self.current_path = None
+        self.query_edit = QLineEdit()
+        self.query_edit.setClearButtonEnabled(True)
+        self.all_books_check = QCheckBox(all_books_text)
+        self.results = QListWidget()
+        self.status_label = QLabel()
+
+        body = QWidget()
+        layout = QVBoxLayout(body)
+        layout.addWidget(self.query_edit)
+        layout.addWidget(self.all_books_check)
+        layout.addWidget(self.results)
+        layout.addWidget(self.status_label)
+        self.setWidget(body)
+
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self.run_query)
+        self.query_edit.textChanged.connect(lambda: self._timer.start(self.QUERY_DELAY_MS))
+        self.query_edit.returnPressed.connect(self.run_query)
+        self.all_books_check.toggled.connect(self.run_query)
+        self.results.itemActivated.connect(self._on_item_activated)
+        self.results.itemClicked.connect(self._on_item_activated)
+        # One thread, so queries reuse its SQLite connection and never overlap.
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fereader_search")
+        self._serial = 0
+        self._finished.connect(self._show_hits)
+
+    def focus_query(self):
+        self.show()
+        self.raise_()
+        self.query_edit.setFocus()
+        self.query_edit.selectAll()
+
+    def run_query(self):
+        self._timer.stop()
+        self._serial += 1
+        self.results.clear()
+        text = self.query_edit.text().strip()
+        if not text:
+            return
+        path = None if self.all_books_check.isChecked() else self.current_path
+        if path is None and not self.all_books_check.isChecked():
+            return
+        serial = self._serial
+        job = self._pool.submit(self._search, serial, text, path)
+        job.add_done_callback(lambda f: self._finished.emit(
+            serial, path, None if f.cancelled() or f.exception() else f.result()))
+
+    def _search(self, serial, text, path):
+        if serial != self._serial:
+            # Superseded while it waited for the previous query.
+            return None
+        return self.index.search(text, path)
+
+    def _show_hits(self, serial, path, hits):
+        if serial != self._serial or hits is None:
+            return
+        for hit in hits:
+            label = f"{hit.page + 1}: {' '.join(hit.snippet.split())}"
+            if path is None:
+                label = f"{os.path.basename(hit.path)} p.{label}"
+            item = QListWidgetItem(label)
+            item.setData(Qt.UserRole, hit)
+            self.results.addItem(item)
+
+    def _on_item_activated(self, item):
+        self.hit_activated.emit(item.data(Qt.UserRole), self.query_edit.text().strip())
+
+class PerfOverlay(QLabel):
+    """Status bar readout of the last render time, page cache hit rate and
+    memory; the tooltip lists recent span averages."""
+    REFRESH_MS = 1000
+
+    def __init__(self, renderer, parent=None):
+        super().__init__(parent)
+        self.renderer = renderer
+        self.sink = perf.RingBufferSink()
+        self._timer = QTimer(self)
+        self._timer.setInterval(self.REFRESH_MS)
+        self._timer.timeout.connect(self.refresh)
+        self.hide()
+
+    def set_active(self, active):
+        if active:
+            perf.add_sink(self.sink)
+            self._timer.start()
+            self.refresh()
+        else:
+            perf.remove_sink(self.sink)
+            self._timer.stop()
+        self.setVisible(active)
+
+    def refresh(self):
+        last = self.sink.last("paint_page" if self.renderer.book_type == "epub" else "render")
+        parts = [f"render {last['ms']:.0f} ms" if last else "render -",
+                 f"cache {self.renderer.cache_stats()['hit_rate']:.0%}"]
+        rss = perf.rss_mb()
+        if rss is not None:
+            parts.append(f"{rss:.0f} MB")
+        mem = self.renderer.memory_stats()
+        if mem["mapped_bytes"]:
+            resident = mem["resident_bytes"]
+            parts.append(f"mapped {mem['mapped_bytes'] / 2 ** 20:.0f} MB"
+                         + (f", {resident / 2 ** 20:.0f} MB resident" if resident is not None else ""))
+        self.setText(" | ".join(parts))
+        self.setToolTip("\n".join(f"{name}: {s['count']}x avg {s['avg_ms']:.1f} ms, max {s['max_ms']:.1f} ms"
+                                  for name, s in sorted(self.sink.summary().items())))
+
 class SettingsDialog(QDialog):
     def __init__(self, parent, fonts, current_font, current_size, current_theme, current_lang):
         super().__init__(parent)
@@ -91,6 +639,40 @@ class SettingsDialog(QDialog):
         lang = self.lang_combo.currentData()
         return {"font_family": self.font_combo.currentText(), "font_size": self.size_spin.value(), "theme": theme, "language": lang}
 
+class ConvertWorker(QThread):
+    """Runs one ConverterLogic conversion off the UI thread."""
+    done = Signal(str)
+    failed = Signal(str)
+
+    def __init__(self, mode, input_paths, output_path, password, parent=None):
+        super().__init__(parent)
+        self.mode = mode
+        self.input_paths = input_paths
+        self.output_path = output_path
+        self.password = password
+
+    def run(self):
+        mode, source, output, pw = self.mode, self.input_paths[0], self.output_path, self.password
+        message = "Conversion completed."
+        try:
+            if mode == "text_pdf":
+                stats = module.ConverterLogic.text_to_pdf(source, output, pw)
+                message = f"Conversion completed: {stats['pages']} pages ({stats['pages_per_sec']:.0f} pages/s)."
+            elif mode == "text_epub":
+                module.ConverterLogic.text_to_epub(source, output)
+            elif mode == "images_pdf":
+                stats = module.ConverterLogic.images_to_pdf(self.input_paths, output, pw)
+                message = f"Conversion completed: {stats['images']} images ({stats['images_per_sec']:.1f} images/s)."
+            elif mode in ("pdf_txt", "pdf_md"):
+                stats = module.ConverterLogic.pdf_to_text(source, output, mode == "pdf_md")
+                message = f"Conversion completed: {stats['pages']} pages ({stats['pages_per_sec']:.0f} pages/s)."
+            elif mode == "epub_txt":
+                stats = module.ConverterLogic.epub_to_text(source, output)
+                message = f"Conversion completed: {stats['chapters']} chapters."
+            self.done.emit(message)
+        except Exception as e:
+            self.failed.emit(str(e))
+
 class ConvertDialog(QDialog):
     def __init__(self, parent, current_lang):
         super().__init__(parent)
@@ -101,6 +683,9 @@ class ConvertDialog(QDialog):
         self.mode_combo.addItem("Text -> PDF", "text_pdf")
         self.mode_combo.addItem("Text -> EPUB", "text_epub")
         self.mode_combo.addItem("Images -> PDF", "images_pdf")
+        self.mode_combo.addItem("PDF -> TXT", "pdf_txt")
+        self.mode_combo.addItem("PDF -> Markdown", "pdf_md")
+        self.mode_combo.addItem("EPUB -> TXT", "epub_txt")
 
         self.input_label = QLabel("Input: (none)")
         self.output_label = QLabel("Output: (none)")
@@ -131,6 +716,7 @@ class ConvertDialog(QDialog):
 
         self.input_paths = []
         self.output_path = ""
+        self.worker = None
 
     def choose_input(self):
         mode = self.mode_combo.currentData()
@@ -140,14 +726,25 @@ class ConvertDialog(QDialog):
                 self.input_paths = paths
                 self.input_label.setText(f"Input: {len(paths)} image(s)")
         else:
-            path, _ = QFileDialog.getOpenFileName(self, "Select text", "", "Text (*.txt);;All (*.*)")
+            if mode in ("pdf_txt", "pdf_md"):
+                title, filters = "Select PDF", "PDF (*.pdf)"
+            elif mode == "epub_txt":
+                title, filters = "Select EPUB", "EPUB (*.epub)"
+            else:
+                title, filters = "Select text", "Text (*.txt);;All (*.*)"
+            path, _ = QFileDialog.getOpenFileName(self, title, "", filters)
             if path:
                 self.input_paths = [path]
                 self.input_label.setText(f"Input: {os.path.basename(path)}")
 
     def choose_output(self):
         mode = self.mode_combo.currentData()
-        ext = "EPUB (*.epub)" if "epub" in mode else "PDF (*.pdf)"
+        if mode in ("pdf_txt", "epub_txt"):
+            ext = "Text (*.txt)"
+        elif mode == "pdf_md":
+            ext = "Markdown (*.md)"
+        else:
+            ext = "EPUB (*.epub)" if "epub" in mode else "PDF (*.pdf)"
         path, _ = QFileDialog.getSaveFileName(self, "Save file", "", ext)
         if path:
             self.output_path = path
@@ -160,28 +757,50 @@ class ConvertDialog(QDialog):
         
         mode = self.mode_combo.currentData()
         pw = self.password_edit.text() if self.password_check.isChecked() else None
-        
-        try:
-            if mode == "text_pdf":
-                module.ConverterLogic.text_to_pdf(self.input_paths[0], self.output_path, pw)
-            elif mode == "text_epub":
-                module.ConverterLogic.text_to_epub(self.input_paths[0], self.output_path)
-            elif mode == "images_pdf":
-                module.ConverterLogic.images_to_pdf(self.input_paths, self.output_path, pw)
-            
-            QMessageBox.information(self, "Success", "Conversion completed.")
-            self.accept()
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Failed: {e}")
+
+        self.worker = ConvertWorker(mode, list(self.input_paths), self.output_path, pw, self)
+        self.worker.done.connect(self._on_convert_done)
+        self.worker.failed.connect(self._on_convert_failed)
+        self._set_busy(True)
+        self.worker.start()
+
+    def _set_busy(self, busy):
+        for widget in (self.mode_combo, self.input_btn, self.output_btn, self.password_check,
+                       self.password_edit, self.convert_btn, self.cancel_btn):
+            widget.setEnabled(not busy)
+        self.convert_btn.setText("Converting..." if busy else "Convert")
+
+    def _on_convert_done(self, message):
+        self.worker.wait()
+        self._set_busy(False)
+        QMessageBox.information(self, "Success", message)
+        self.accept()
+
+    def _on_convert_failed(self, error):
+        self.worker.wait()
+        self._set_busy(False)
+        QMessageBox.critical(self, "Error", f"Failed: {error}")
+
+    def reject(self):
+        # The conversion cannot be interrupted; the dialog stays until it ends.
+        if self.worker is not None and self.worker.isRunning():
+            return
+        super().reject()
 
 class FeReaderWindow(QMainWindow):
+    # Quiet time before chapter pages are counted, then the gap between chapters.
+    PAGE_COUNT_IDLE_MS = 400
+    PAGE_COUNT_TICK_MS = 50
+
     def __init__(self):
         super().__init__()
         
         self.cfg_mgr = module.ConfigManager()
         self.settings = QSettings("Neofilisoft", "FeReader")
         
-        self.renderer = render.RenderEngine()
+        self.renderer = render.RenderEngine(disk_cache=render.DiskCache())
+        self.scheduler = RenderScheduler(self.renderer, self)
+        self.scheduler.image_ready.connect(self._show_page_image)
 
         self.language = self.cfg_mgr.get("language")
         self.theme = self.cfg_mgr.get("theme")
@@ -195,6 +814,23 @@ class FeReaderWindow(QMainWindow):
         self.view_mode = "single"
         self.view_orientation = "vertical"
         self._continuous_needs_build = True
+        self.loader = None
+        self.current_path = None
+        self.search_index = search.SearchIndex()
+        self.indexer = None
+        self._pending_hit = None
+        self._search_highlight = None
+        self._first_page_shown = False
+        self._shown_zoom = None
+        self._syncing_scroll = False
+        # EPUB position: page within chapter current_index, the character
+        # offset at its top (kept across re-pagination) and a search hit.
+        self.epub_page = 0
+        self._epub_position = None
+        self._epub_highlight = None
+        self._font_ids = {}
+        self._user_fonts = {}
+        self._font_family_list = None
 
         self._load_user_fonts()
         self.setWindowTitle(f"FeReader - Version {module.APP_VERSION}")
@@ -203,8 +839,23 @@ class FeReaderWindow(QMainWindow):
         # UI Components
         self.stack = QStackedWidget()
         self.text_view = QTextBrowser()
-        self.text_view.setOpenExternalLinks(True)
-        self.text_view.selectionChanged.connect(self._handle_text_selection)
+
+        self.epub_view = EpubPageView()
+        self.epub_view.on_scroll_prev = self.go_prev
+        self.epub_view.on_scroll_next = self.go_next
+        self.epub_view.link_activated.connect(self._open_epub_link)
+        self.epub_view.selection_changed.connect(self._handle_text_selection)
+        self._epub_resize_timer = QTimer(self)
+        self._epub_resize_timer.setSingleShot(True)
+        self._epub_resize_timer.setInterval(150)
+        self._epub_resize_timer.timeout.connect(self._on_epub_resized)
+        self.epub_view.resized.connect(self._epub_resize_timer.start)
+        # Counts the remaining chapters' pages, one chapter per tick. A layout
+        # holds the UI thread for up to ~100 ms, so every page turn or resize
+        # pushes the next tick back until the reader pauses.
+        self._page_count_timer = QTimer(self)
+        self._page_count_timer.setSingleShot(True)
+        self._page_count_timer.timeout.connect(self._count_epub_pages)
 
         self.single_image_label = QLabel()
         self.single_image_label.setAlignment(Qt.AlignCenter)
@@ -214,24 +865,52 @@ class FeReaderWindow(QMainWindow):
         self.single_scroll.on_scroll_prev = self.go_prev
         self.single_scroll.on_scroll_next = self.go_next
 
+        self.tile_view = TiledPageWidget(self.renderer)
+        self.tile_scroll = PageScrollArea()
+        self.tile_scroll.setAlignment(Qt.AlignCenter)
+        self.tile_scroll.setWidget(self.tile_view)
+        self.tile_scroll.on_scroll_prev = self.go_prev
+        self.tile_scroll.on_scroll_next = self.go_next
+
         self.multi_container = QWidget()
         self.multi_layout = QVBoxLayout(self.multi_container)
         self.multi_layout.setAlignment(Qt.AlignHCenter | Qt.AlignTop)
         
+        self.continuous_view = ContinuousPageWidget(self.renderer)
+        self.multi_layout.addWidget(self.continuous_view)
+        
         self.multi_scroll = QScrollArea()
         self.multi_scroll.setWidgetResizable(True)
         self.multi_scroll.setWidget(self.multi_container)
+        self.multi_scroll.verticalScrollBar().valueChanged.connect(self._on_continuous_scroll)
 
         self.stack.addWidget(self.text_view)
+        self.stack.addWidget(self.epub_view)
         self.stack.addWidget(self.single_scroll)
+        self.stack.addWidget(self.tile_scroll)
         self.stack.addWidget(self.multi_scroll)
         self.setCentralWidget(self.stack)
 
         self._create_actions()
         self._create_toolbar()
         self.setStatusBar(QStatusBar())
+        self.load_progress = QProgressBar()
+        self.load_progress.setMaximumWidth(220)
+        self.load_cancel_btn = QPushButton("Cancel")
+        self.load_cancel_btn.clicked.connect(self._cancel_loading)
+        self.statusBar().addPermanentWidget(self.load_progress)
+        self.statusBar().addPermanentWidget(self.load_cancel_btn)
+        self.perf_overlay = PerfOverlay(self.renderer, self)
+        self.statusBar().addPermanentWidget(self.perf_overlay)
+        self.perf_overlay.set_active(self.perf_action.isChecked())
+        self._set_loading_ui(False)
         self._update_statusbar()
 
+        self.search_panel = SearchPanel(self.search_index, self.tr("search"), self.tr("all_books"), self)
+        self.search_panel.hit_activated.connect(self.show_search_hit)
+        self.addDockWidget(Qt.RightDockWidgetArea, self.search_panel)
+        self.search_panel.hide()
+
         self.apply_theme()
         self.apply_language()
 
@@ -240,7 +919,12 @@ class FeReaderWindow(QMainWindow):
         return bundle.get(key, key)
 
     def closeEvent(self, event):
+        self._cancel_loading(wait=True)
+        self._stop_indexer()
+        self.search_index.close()
+        self.scheduler.cancel()
         self.renderer.cleanup()
+        self.renderer.disk_cache.close()
         self.save_settings()
         self.settings.setValue("window/geometry", self.saveGeometry())
         event.accept()
@@ -256,22 +940,82 @@ class FeReaderWindow(QMainWindow):
         self.cfg_mgr.set("display_mode", mode)
         self.cfg_mgr.save()
 
+    def _register_font(self, name):
+        """Add a font file from APP_DIR to Qt once; returns its families."""
+        if name not in self._font_ids:
+            try: self._font_ids[name] = QFontDatabase.addApplicationFont(os.path.join(module.APP_DIR, name))
+            except Exception: self._font_ids[name] = -1
+        font_id = self._font_ids[name]
+        return QFontDatabase.applicationFontFamilies(font_id) if font_id >= 0 else []
+
+    def _scan_user_fonts(self):
+        """Map the font files in APP_DIR to their families. The map is kept in
+        QSettings and trusted while the directory's mtime is unchanged; after
+        that, only new or modified files are opened again."""
+        try:
+            dir_mtime = os.stat(module.APP_DIR).st_mtime
+        except OSError:
+            return {}
+        try:
+            cached = json.loads(self.settings.value("fonts/user_fonts", "") or "{}")
+        except ValueError:
+            cached = {}
+        if cached.get("mtime") == dir_mtime:
+            return cached.get("fonts", {})
+        old = cached.get("fonts", {})
+        fonts = {}
+        for name in sorted(os.listdir(module.APP_DIR)):
+            if not name.lower().endswith((".ttf", ".otf")):
+                continue
+            try:
+                st = os.stat(os.path.join(module.APP_DIR, name))
+            except OSError:
+                continue
+            stamp = [st.st_size, st.st_mtime]
+            if name in old and old[name]["stamp"] == stamp:
+                fonts[name] = old[name]
+                continue
+            font_id = self._font_ids.pop(name, -1)
+            if font_id >= 0:
+                QFontDatabase.removeApplicationFont(font_id)
+            fonts[name] = {"stamp": stamp, "families": self._register_font(name)}
+        self.settings.setValue("fonts/user_fonts", json.dumps({"mtime": dir_mtime, "fonts": fonts}))
+        return fonts
+
     def _load_user_fonts(self):
-        for name in os.listdir(module.APP_DIR):
-            if name.lower().endswith((".ttf", ".otf")):
-                try: QFontDatabase.addApplicationFont(os.path.join(module.APP_DIR, name))
-                except: pass
+        # Only the font in use is needed to show the window; the others are
+        # registered when the settings dialog lists them.
+        self._user_fonts = self._scan_user_fonts()
+        for name, entry in self._user_fonts.items():
+            if self.font_family in entry["families"]:
+                self._register_font(name)
+
+    def _font_families(self):
+        fonts = self._scan_user_fonts()
+        if self._font_family_list is None or fonts != self._user_fonts:
+            self._user_fonts = fonts
+            for name in fonts:
+                self._register_font(name)
+            self._font_family_list = sorted(set(QFontDatabase.families()))
+        return self._font_family_list
 
     def apply_language(self):
         self.menu_btn.setText(self.tr("menu"))
         self.prev_action.setText(self.tr("prev"))
         self.next_action.setText(self.tr("next"))
+        self.goto_action.setText(self.tr("goto"))
+        self.search_action.setText(self.tr("search"))
+        self.search_panel.setWindowTitle(self.tr("search"))
+        self.search_panel.all_books_check.setText(self.tr("all_books"))
+        self.perf_action.setText(self.tr("perf_overlay"))
+        self.night_action.setText(self.tr("night_mode"))
+        self.night_images_action.setText(self.tr("night_keep_images"))
     
     def apply_theme(self):
         bg, fg = ("#202020", "#f0f0f0") if self.theme == "dark" else ("#ffffff", "#000000")
         tb_bg = "#f5f5f5" if self.theme == "dark" else "#f2f2f2"
         self.setStyleSheet(f"""
-            QMainWindow, QTextBrowser, QScrollArea {{ background-color: {bg}; color: {fg}; }}
+            QMainWindow, QTextBrowser, QScrollArea, EpubPageView {{ background-color: {bg}; color: {fg}; }}
             QLabel {{ color: {fg}; }}
             QToolBar {{ background: {tb_bg}; border: none; spacing: 6px; }}
             QToolButton::menu-indicator {{ image: none; }}
@@ -287,6 +1031,27 @@ class FeReaderWindow(QMainWindow):
         self.prev_action.triggered.connect(self.go_prev)
         self.next_action = QAction(self.tr("next"), self)
         self.next_action.triggered.connect(self.go_next)
+        self.goto_action = QAction(self.tr("goto"), self)
+        self.goto_action.setShortcut(QKeySequence("Ctrl+G"))
+        self.goto_action.triggered.connect(self.go_to_page)
+        self.search_action = QAction(self.tr("search"), self)
+        self.search_action.setShortcut(QKeySequence("Ctrl+F"))
+        self.search_action.triggered.connect(self.open_search)
+        self.perf_action = QAction(self.tr("perf_overlay"), self)
+        self.perf_action.setShortcut(QKeySequence("Ctrl+Shift+P"))
+        self.perf_action.setCheckable(True)
+        self.perf_action.setChecked(self.settings.value("view/perf_overlay", False, type=bool))
+        self.perf_action.toggled.connect(self.toggle_perf_overlay)
+        self.night_action = QAction(self.tr("night_mode"), self)
+        self.night_action.setShortcut(QKeySequence("Ctrl+Shift+N"))
+        self.night_action.setCheckable(True)
+        self.night_action.setChecked(self.settings.value("view/night_mode", False, type=bool))
+        self.night_images_action = QAction(self.tr("night_keep_images"), self)
+        self.night_images_action.setCheckable(True)
+        self.night_images_action.setChecked(self.settings.value("view/night_keep_images", True, type=bool))
+        self.renderer.set_night_mode(self.night_action.isChecked(), self.night_images_action.isChecked())
+        self.night_action.toggled.connect(self.toggle_night_mode)
+        self.night_images_action.toggled.connect(self.toggle_night_mode)
 
     def _create_toolbar(self):
         tb = QToolBar("Main")
@@ -316,6 +1081,17 @@ class FeReaderWindow(QMainWindow):
         self.v_act.setCheckable(True)
         self.h_act.setCheckable(True)
         self.v_act.setChecked(True)
+        self.view_menu.addSeparator()
+        self.one_page_act = self.view_menu.addAction(self.tr("one_page"), lambda: self.set_view_mode("single"))
+        self.all_pages_act = self.view_menu.addAction(self.tr("all_pages"), lambda: self.set_view_mode("continuous"))
+        self.one_page_act.setCheckable(True)
+        self.all_pages_act.setCheckable(True)
+        self.one_page_act.setChecked(True)
+        self.view_menu.addSeparator()
+        self.view_menu.addAction(self.night_action)
+        self.view_menu.addAction(self.night_images_action)
+        self.view_menu.addSeparator()
+        self.view_menu.addAction(self.perf_action)
         
         self.view_btn.setMenu(self.view_menu)
         self.view_btn.setText(self.tr("view"))
@@ -324,6 +1100,8 @@ class FeReaderWindow(QMainWindow):
         tb.addSeparator()
         tb.addAction(self.prev_action)
         tb.addAction(self.next_action)
+        tb.addAction(self.goto_action)
+        tb.addAction(self.search_action)
         
         tb.addSeparator()
         tb.addAction("🔍+", self.zoom_in)
@@ -336,24 +1114,101 @@ class FeReaderWindow(QMainWindow):
     def open_file(self):
         path, _ = QFileDialog.getOpenFileName(self, "Open", "", "Files (*.pdf *.epub)")
         if not path: return
-        
+        self.open_path(path)
+
+    def open_path(self, path):
         ext = os.path.splitext(path)[1].lower()
-        try:
-            if ext == ".pdf":
-                self.renderer.load_pdf(path, lambda: QInputDialog.getText(self, "Password", "Enter:", QLineEdit.Password)[0])
-                self.current_zoom = self.renderer.get_initial_zoom(self.single_scroll.width()-25, self.single_scroll.height()-25)
-            elif ext == ".epub":
-                self.renderer.load_epub(path)
-                self.current_font_size = self.base_font_size
-            else:
-                return
+        if ext not in (".pdf", ".epub"):
+            return
+
+        self._cancel_loading(wait=True)
+        self._stop_indexer()
+        self.scheduler.cancel()
+        self.renderer.cleanup()
+        self.current_path = None
+        self.search_panel.current_path = None
+        self._search_highlight = None
+        self._page_count_timer.stop()
+        self.epub_view.clear()
+        self.epub_page = 0
+        self._epub_position = None
+        self._epub_highlight = None
+        self.current_book_title = os.path.basename(path)
+        self.current_index = 0
+        self._first_page_shown = False
+        self._update_view()
 
-            self.current_book_title = os.path.basename(path)
-            self.current_index = 0
-            self.load_highlights()
+        self.loader = DocumentLoader(self.renderer, path, self)
+        self.loader.path = path
+        self.loader.progress.connect(self._on_load_progress)
+        self.loader.loaded.connect(self._on_loaded)
+        self.loader.failed.connect(self._on_load_failed)
+        self.loader.cancelled.connect(self._on_load_cancelled)
+        self.loader.password_needed.connect(self._prompt_password, Qt.BlockingQueuedConnection)
+        self._set_loading_ui(True)
+        self.loader.start()
+
+    def _set_loading_ui(self, loading):
+        self.load_progress.setRange(0, 0)
+        self.load_progress.setVisible(loading)
+        self.load_cancel_btn.setVisible(loading)
+
+    def _cancel_loading(self, wait=False):
+        if self.loader and self.loader.isRunning():
+            self.loader.cancel()
+            if wait:
+                self.loader.wait()
+
+    def _prompt_password(self):
+        self.loader.password = QInputDialog.getText(self, "Password", "Enter:", QLineEdit.Password)[0]
+
+    def _on_load_progress(self, stage, done, total):
+        if self.sender() is not self.loader:
+            return
+        self.load_progress.setRange(0, total)
+        self.load_progress.setValue(done)
+        self.load_progress.setFormat(f"{stage.capitalize()} %v/%m")
+        if stage == "chapters" and not self._first_page_shown:
+            self._first_page_shown = True
             self._update_view()
-        except Exception as e:
-            QMessageBox.critical(self, "Error", str(e))
+        else:
+            self._update_statusbar()
+
+    def _on_loaded(self):
+        if self.sender() is not self.loader:
+            return
+        self._set_loading_ui(False)
+        self._continuous_needs_build = True
+        self.current_path = self.loader.path
+        self.search_panel.current_path = self.current_path
+        if self.renderer.book_type == "pdf":
+            self.current_zoom = self.renderer.get_initial_zoom(self.single_scroll.width()-25, self.single_scroll.height()-25)
+        else:
+            self.current_font_size = self.base_font_size
+        self.load_highlights()
+        self._start_indexer()
+        hit = self._pending_hit
+        self._pending_hit = None
+        if hit is not None:
+            self.show_search_hit(*hit)
+        else:
+            self._update_view()
+
+    def _on_load_failed(self, message):
+        if self.sender() is not self.loader:
+            return
+        self._set_loading_ui(False)
+        self.renderer.cleanup()
+        self._update_view()
+        QMessageBox.critical(self, "Error", message)
+
+    def _on_load_cancelled(self):
+        if self.sender() is not self.loader:
+            return
+        self._set_loading_ui(False)
+        self.renderer.cleanup()
+        self.current_book_title = "Untitled"
+        self._update_view()
 
     def _update_view(self):
         if not self.renderer.pages:
@@ -363,42 +1218,208 @@ class FeReaderWindow(QMainWindow):
             return
 
         if self.renderer.book_type == "epub":
-            self.stack.setCurrentWidget(self.text_view)
-            self.text_view.setHtml(self.renderer.pages[self.current_index])
-            self.text_view.setFont(QFont(self.font_family, self.current_font_size))
+            self.stack.setCurrentWidget(self.epub_view)
+            self._show_epub_page()
         
+        elif self.renderer.book_type == "pdf" and self.view_mode == "continuous":
+            self.stack.setCurrentWidget(self.multi_scroll)
+            if self._continuous_needs_build or self.continuous_view.zoom != self.current_zoom:
+                self._continuous_needs_build = False
+                self.continuous_view.build(self.current_zoom)
+                self.multi_layout.activate()
+            self._scroll_continuous_to(self.current_index)
+
+        elif self.renderer.book_type == "pdf" and self._use_tiles():
+            self.stack.setCurrentWidget(self.tile_scroll)
+            self.single_image_label.clear()
+            self.tile_view.set_page(self.current_index, self.current_zoom)
+
         elif self.renderer.book_type == "pdf":
             self.stack.setCurrentWidget(self.single_scroll)
-            if self.view_orientation == "horizontal":
-                pix = self.renderer.get_pdf_spread_pixmap(self.current_index, self.current_zoom)
-            else:
-                pix = self.renderer.get_pdf_page_pixmap(self.current_index, self.current_zoom)
-            
-            if pix:
-                self.single_image_label.setPixmap(pix)
-                self.single_image_label.adjustSize()
+            spread = self.view_orientation == "horizontal"
+            if not self.scheduler.request(self.current_index, self.current_zoom, spread):
+                self._show_scaled_preview(self.current_zoom)
         
         self._update_statusbar()
         self._update_zoom_label()
 
+    def _show_epub_page(self):
+        paginator = self.renderer.paginator
+        repaginated = paginator.configure(self.font_family, self.current_font_size,
+                                          self.epub_view.width(), self.epub_view.height())
+        if repaginated:
+            # Only the current chapter is laid out now; the rest are counted
+            # while idle.
+            if self._epub_position is not None:
+                self.epub_page = paginator.page_of(self.current_index, self._epub_position)
+        if not paginator.exact:
+            self._page_count_timer.start(self.PAGE_COUNT_IDLE_MS)
+        doc = paginator.document(self.current_index)
+        self.epub_page = max(0, min(self.epub_page, doc.pageCount() - 1))
+        highlight = None
+        if self._epub_highlight and self._epub_highlight[0] == self.current_index:
+            highlight = self._epub_highlight[1]
+        self.epub_view.show_page(doc, self.epub_page, paginator.page_height, highlight)
+        # Keep the old offset across re-pagination, so repeated resizes do not drift.
+        if not repaginated or self._epub_position is None:
+            self._epub_position = paginator.position_at(self.current_index, self.epub_page)
+
+    def _on_epub_resized(self):
+        if self.renderer.book_type == "epub" and self.renderer.pages:
+            self._update_view()
+
+    def _count_epub_pages(self):
+        paginator = self.renderer.paginator
+        if self.renderer.book_type == "epub" and paginator.params is not None and paginator.count_next():
+            self._page_count_timer.start(self.PAGE_COUNT_TICK_MS)
+        self._update_statusbar()
+
+    def _turn_epub_page(self, step):
+        paginator = self.renderer.paginator
+        page, index = self.epub_page + step, self.current_index
+        if page >= paginator.page_count(index):
+            if index + 1 >= len(self.renderer.pages):
+                return
+            index, page = index + 1, 0
+        elif page < 0:
+            if index == 0:
+                return
+            index -= 1
+            page = paginator.document(index).pageCount() - 1
+        self._go_epub(index, page)
+
+    def _go_epub(self, index, page):
+        self.current_index, self.epub_page = index, page
+        self._epub_position = None
+        self._update_view()
+
+    def _open_epub_link(self, href):
+        url = QUrl(href)
+        if not url.isRelative():
+            QDesktopServices.openUrl(url)
+            return
+        current = self.renderer.pages[self.current_index]
+        name = posixpath.normpath(posixpath.join(posixpath.dirname(current), url.path())) if url.path() else current
+        if name not in self.renderer.pages:
+            return
+        index, page = self.renderer.pages.index(name), 0
+        if url.fragment():
+            position = self.renderer.paginator.anchor_position(index, url.fragment())
+            if position is not None:
+                page = self.renderer.paginator.page_of(index, position)
+        self._go_epub(index, page)
+
+    def _show_page_image(self, target, img):
+        if self.renderer.book_type != "pdf" or self.view_mode != "single" or self._use_tiles():
+            return
+        index, zoom, spread = target
+        pixmap = QPixmap.fromImage(img)
+        self._paint_search_highlight(pixmap, index, spread)
+        with perf.span("set_pixmap", page=index, zoom=round(zoom, 3)):
+            self.single_image_label.setPixmap(pixmap)
+            self.single_image_label.adjustSize()
+        self._shown_zoom = zoom
+        self.renderer.prefetch(index, zoom, spread)
+
+    def _paint_search_highlight(self, pixmap, index, spread):
+        if self._search_highlight is None:
+            return
+        hit_index, rects = self._search_highlight
+        page_rects = self.renderer.get_page_rects()
+        painter = QPainter(pixmap)
+        painter.setPen(Qt.NoPen)
+        painter.setBrush(QColor(255, 200, 0, 100))
+        x = 0.0
+        for i in (index, index + 1) if spread else (index,):
+            if i >= len(page_rects):
+                break
+            # Spread pages share the image height, so each has its own scale.
+            scale = pixmap.height() / page_rects[i].height
+            if i == hit_index:
+                for r in rects:
+                    painter.drawRect(QRectF(x + r.x0 * scale, r.y0 * scale, r.width * scale, r.height * scale))
+            x += page_rects[i].width * scale
+        painter.end()
+
+    def _show_scaled_preview(self, zoom):
+        """Stretch the last pixmap to the new zoom until the sharp render lands."""
+        pix = self.single_image_label.pixmap()
+        if pix.isNull() or not self._shown_zoom or abs(zoom - self._shown_zoom) < 1e-6:
+            return
+        factor = zoom / self._shown_zoom
+        self.single_image_label.setPixmap(pix.scaled(pix.size() * factor, Qt.KeepAspectRatio, Qt.FastTransformation))
+        self.single_image_label.adjustSize()
+        self._shown_zoom = zoom
+
+    def _scroll_continuous_to(self, index):
+        self._syncing_scroll = True
+        self.multi_scroll.verticalScrollBar().setValue(self.continuous_view.y() + self.continuous_view.page_top(index))
+        self._syncing_scroll = False
+        self._refresh_continuous()
+
+    def _on_continuous_scroll(self, value):
+        if self._syncing_scroll or self.view_mode != "continuous" or self.renderer.book_type != "pdf":
+            return
+        top = value - self.continuous_view.y()
+        self.current_index = self.continuous_view.page_at(top + self.multi_scroll.viewport().height() // 3)
+        self._refresh_continuous()
+        self._update_statusbar()
+
+    def _refresh_continuous(self):
+        top = self.multi_scroll.verticalScrollBar().value() - self.continuous_view.y()
+        self.continuous_view.refresh(top, top + self.multi_scroll.viewport().height())
+
+    def _use_tiles(self):
+        return self.view_orientation == "vertical" and self.current_zoom >= render.TILED_ZOOM_THRESHOLD
+
+    def _spread_mode(self):
+        return self.renderer.book_type == "pdf" and self.view_orientation == "horizontal" and self.view_mode == "single"
+
     def go_prev(self):
         if not self.renderer.pages: return
-        step = 2 if (self.renderer.book_type == "pdf" and self.view_orientation == "horizontal") else 1
+        if self.renderer.book_type == "epub":
+            self._turn_epub_page(-1)
+            return
+        step = 2 if self._spread_mode() else 1
         self.current_index = max(0, self.current_index - step)
         self._update_view()
 
     def go_next(self):
         if not self.renderer.pages: return
-        step = 2 if (self.renderer.book_type == "pdf" and self.view_orientation == "horizontal") else 1
+        if self.renderer.book_type == "epub":
+            self._turn_epub_page(1)
+            return
+        step = 2 if self._spread_mode() else 1
         limit = len(self.renderer.pages) - 1
-        if self.renderer.book_type == "pdf" and self.view_orientation == "horizontal" and limit % 2 != 0:
+        if self._spread_mode() and limit % 2 != 0:
              limit -= 1
         self.current_index = min(limit, self.current_index + step)
         self._update_view()
 
+    def go_to_page(self):
+        if not self.renderer.pages: return
+        paginator = self.renderer.paginator
+        if self.renderer.book_type == "epub" and paginator.params is not None:
+            count = paginator.total_pages()
+            current = paginator.first_page(self.current_index) + self.epub_page + 1
+            val, ok = QInputDialog.getInt(self, self.tr("goto"), f"1-{count}:", current, 1, count)
+            if ok:
+                self._go_epub(*paginator.locate(val - 1))
+            return
+        count = len(self.renderer.pages)
+        val, ok = QInputDialog.getInt(self, self.tr("goto"), f"1-{count}:", self.current_index + 1, 1, count)
+        if ok:
+            index = val - 1
+            if self._spread_mode():
+                index -= index % 2
+            self.renderer.cancel_prefetch()
+            self.current_index = index
+            self._update_view()
+
     def zoom_in(self):
         if self.renderer.book_type == "pdf":
             self.current_zoom = min(5.0, self.current_zoom + 0.1)
+            self.renderer.cancel_prefetch()
         else:
             self.current_font_size = min(60, self.current_font_size + 2)
         self._update_view()
@@ -406,6 +1427,7 @@ class FeReaderWindow(QMainWindow):
     def zoom_out(self):
         if self.renderer.book_type == "pdf":
             self.current_zoom = max(0.1, self.current_zoom - 0.1)
+            self.renderer.cancel_prefetch()
         else:
             self.current_font_size = max(8, self.current_font_size - 2)
         self._update_view()
@@ -413,9 +1435,64 @@ class FeReaderWindow(QMainWindow):
     def zoom_label_clicked(self):
         val, ok = QInputDialog.getInt(self, "Zoom", "Percent:", int(self.current_zoom*100), 50, 300)
         if ok:
-            if self.renderer.book_type == "pdf": self.current_zoom = val/100.0
-            else: self.current_font_size = int(self.base_font_size * (val/100.0))
+            if self.renderer.book_type == "pdf":
+                self.current_zoom = val/100.0
+                self.renderer.cancel_prefetch()
+            else:
+                self.current_font_size = int(self.base_font_size * (val/100.0))
+            self._update_view()
+
+    def open_search(self):
+        self.search_panel.focus_query()
+
+    def show_search_hit(self, hit, text):
+        if hit.path != self.current_path:
+            self._pending_hit = (hit, text)
+            self.open_path(hit.path)
+            return
+        index = hit.page
+        if self._spread_mode():
+            index -= index % 2
+        self.renderer.cancel_prefetch()
+        self.current_index = index
+        if self.renderer.book_type == "pdf":
+            self._search_highlight = (hit.page, self.renderer.get_search_rects(hit.page, text))
+            # The cached image carries no highlight, so force a fresh show.
+            self.scheduler.cancel()
+            self.single_image_label.clear()
+            self._update_view()
+        else:
+            terms = text.split()
+            self.epub_page = 0
+            self._epub_position = None
             self._update_view()
+            match = self.renderer.paginator.find(index, terms[0] if terms else text)
+            self._epub_highlight = (index, match) if match else None
+            if match:
+                self.epub_page = self.renderer.paginator.page_of(index, match[0])
+                self._update_view()
+
+    def _start_indexer(self):
+        self._stop_indexer()
+        self.indexer = SearchIndexer(self.search_index, self.current_path, self)
+        self.indexer.progress.connect(self._on_index_progress)
+        self.indexer.start()
+
+    def _stop_indexer(self):
+        if self.indexer and self.indexer.isRunning():
+            self.indexer.cancel()
+            self.indexer.wait()
+        self.indexer = None
+
+    def _on_index_progress(self, done, total):
+        if self.sender() is not self.indexer:
+            return
+        if done < total:
+            self.search_panel.status_label.setText(f"{self.tr('indexing')} {done}/{total}")
+        else:
+            self.search_panel.status_label.setText("")
+            if self.search_panel.isVisible():
+                self.search_panel.run_query()
 
     def set_view_orientation(self, mode):
         self.view_orientation = mode
@@ -423,9 +1500,27 @@ class FeReaderWindow(QMainWindow):
         self.h_act.setChecked(mode == "horizontal")
         self._update_view()
 
+    def set_view_mode(self, mode):
+        self.view_mode = mode
+        self.one_page_act.setChecked(mode == "single")
+        self.all_pages_act.setChecked(mode == "continuous")
+        self.scheduler.cancel()
+        if self._spread_mode():
+            self.current_index -= self.current_index % 2
+        self._update_view()
+
     def _update_statusbar(self):
         count = len(self.renderer.pages)
-        msg = f"{self.current_book_title} | Page {self.current_index + 1}/{count}" if count else self.tr("no_document")
+        paginator = self.renderer.paginator
+        if count and self.renderer.book_type == "epub" and paginator.params is not None:
+            # Chapters not laid out yet are estimated, so the total is approximate.
+            page = paginator.first_page(self.current_index) + self.epub_page + 1
+            total = ("" if paginator.exact else "~") + str(paginator.total_pages())
+            msg = f"{self.current_book_title} | Page {page}/{total}"
+        elif count:
+            msg = f"{self.current_book_title} | Page {self.current_index + 1}/{count}"
+        else:
+            msg = self.tr("no_document")
         self.statusBar().showMessage(msg)
 
     def _update_zoom_label(self):
@@ -434,6 +1529,18 @@ class FeReaderWindow(QMainWindow):
         else:
             self.zoom_label.setText(f"{int(self.current_font_size/self.base_font_size * 100)}%")
 
+    def toggle_perf_overlay(self, checked):
+        self.perf_overlay.set_active(checked)
+        self.settings.setValue("view/perf_overlay", checked)
+
+    def toggle_night_mode(self):
+        night, keep_images = self.night_action.isChecked(), self.night_images_action.isChecked()
+        self.settings.setValue("view/night_mode", night)
+        self.settings.setValue("view/night_keep_images", keep_images)
+        if self.renderer.set_night_mode(night, keep_images):
+            self._continuous_needs_build = True
+            self._update_view()
+
     def toggle_fullscreen(self):
         if self.isFullScreen(): self.showNormal()
         else: self.showFullScreen()
@@ -445,8 +1552,7 @@ class FeReaderWindow(QMainWindow):
         pass
 
     def open_settings_dialog(self):
-        fonts = sorted(set(QFontDatabase().families()))
-        dlg = SettingsDialog(self, fonts, self.font_family, self.base_font_size, self.theme, self.language)
+        dlg = SettingsDialog(self, self._font_families(), self.font_family, self.base_font_size, self.theme, self.language)
         if dlg.exec() == QDialog.Accepted:
             v = dlg.get_values()
             self.font_family = v["font_family"]; self.base_font_size = v["font_size"]
@@ -458,13 +1564,23 @@ class FeReaderWindow(QMainWindow):
         ConvertDialog(self, self.language).exec()
 
 def main():
+    imported = time.perf_counter()
     app = QApplication(sys.argv)
+    trace_path = os.environ.get("FEREADER_TRACE")
+    if trace_path:
+        perf.add_sink(perf.JsonLinesSink(trace_path))
     window = FeReaderWindow()
     mode = window.cfg_mgr.get("display_mode", "1")
     if mode == "2": window.showFullScreen()
     elif mode == "1": window.showMaximized()
     else: window.show()
+    # Runs once the first frame has been laid out and painted.
+    QTimer.singleShot(0, lambda: perf.emit(
+        "startup", (time.perf_counter() - _STARTED) * 1000,
+        imports_ms=round((imported - _STARTED) * 1000, 1), window_ms=round((time.perf_counter() - imported) * 1000, 1)))
     sys.exit(app.exec())
 
 if __name__ == "__main__":
+    # Image conversion runs in worker processes, which frozen builds must support.
+    multiprocessing.freeze_support()
     main()
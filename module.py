@@ -2,8 +2,41 @@ import sys
 import os
 import configparser
 import json
-import fitz 
-from ebooklib import epub
+import functools
+import re
+import html
+import uuid
+import hashlib
+import time
+import zlib
+import importlib
+import importlib.util
+import mmap
+import multiprocessing
+import struct
+import posixpath
+import zipfile
+import xml.etree.ElementTree as ET
+from urllib.parse import unquote
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import perf
+
+class LazyModule:
+    """Stands in for a heavy module and imports it on first attribute access,
+    so starting the UI does not pay for MuPDF or BeautifulSoup."""
+    def __init__(self, name):
+        self._name = name
+
+    def __getattr__(self, attr):
+        value = getattr(importlib.import_module(self._name), attr)
+        setattr(self, attr, value)
+        return value
+
+fitz = LazyModule("fitz")
+bs4 = LazyModule("bs4")
+numpy = LazyModule("numpy") if importlib.util.find_spec("numpy") else None
 
 APP_VERSION = "3.1.2"
 
@@ -23,6 +56,9 @@ LANG_STRINGS = {
         "settings_title": "Settings", "convert_title": "Convert",
         "no_document": "No document loaded.", "view": "View",
         "vertical": "Vertical", "horizontal": "Horizon",
+        "search": "Search", "all_books": "All books", "indexing": "Indexing",
+        "perf_overlay": "Performance overlay",
+        "night_mode": "Night mode pages", "night_keep_images": "Keep pictures in night mode",
     },
     "th": {
         "menu": "ไฟล์", "open": "เปิด", "settings": "ตั้งค่า", "convert": "แปลงเอกสาร",
@@ -34,13 +70,102 @@ LANG_STRINGS = {
         "settings_title": "ตั้งค่า", "convert_title": "แปลงเอกสาร",
         "no_document": "ยังไม่มีเอกสารถูกเปิด", "view": "มุมมอง",
         "vertical": "แนวตั้ง", "horizontal": "อ่านแบบซ้ายขวาเหมือนหนังสือ",
+        "search": "ค้นหา", "all_books": "ทุกเล่ม", "indexing": "กำลังทำดัชนี",
+        "perf_overlay": "แสดงประสิทธิภาพ",
+        "night_mode": "โหมดกลางคืน", "night_keep_images": "คงสีรูปภาพในโหมดกลางคืน",
     },
 }
 
+FINGERPRINT_CHUNK = 1024 * 1024
+TEXT_READ_CHUNK = 64 * 1024
+EPUB_CHAPTER_BYTES = 256 * 1024
+# Darker than this becomes black in bilevel image output.
+BILEVEL_THRESHOLD = 128
+# Work handed to one text extraction worker at a time.
+PDF_PAGES_PER_TASK = 32
+EPUB_ITEMS_PER_TASK = 4
+# Read ahead of the zip local header when an EPUB item is about to be read.
+ZIP_HEADER_READAHEAD = 1024
+
+def file_fingerprint(path):
+    """Hash of a file's size, head and tail; cheap even for huge books."""
+    size = os.path.getsize(path)
+    digest = hashlib.sha1(str(size).encode())
+    with open(path, "rb") as f:
+        digest.update(f.read(FINGERPRINT_CHUNK))
+        if size > FINGERPRINT_CHUNK:
+            f.seek(max(FINGERPRINT_CHUNK, size - FINGERPRINT_CHUNK))
+            digest.update(f.read(FINGERPRINT_CHUNK))
+    return digest.hexdigest()
+
+class _Mmap(mmap.mmap):
+    # zipfile asks for seekable(), which mmap only has from Python 3.13.
+    def seekable(self):
+        return True
+
+class MappedFile:
+    """A read-only memory map of a file. Opening costs the same for any file
+    size; bytes are read from disk (or a network share) when first touched,
+    and the OS can drop them again under memory pressure."""
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            st = os.fstat(f.fileno())
+            if st.st_size == 0:
+                raise ValueError("File is empty")
+            self.map = _Mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.path = path
+        self.size = st.st_size
+        self._inode = st.st_ino
+        self.view = memoryview(self.map)
+
+    def _advise(self, advice, offset=0, length=None):
+        # madvise is a hint; Windows has none and leaves read-ahead to the OS.
+        if not hasattr(self.map, "madvise") or not hasattr(mmap, advice):
+            return
+        start = max(0, offset) // mmap.PAGESIZE * mmap.PAGESIZE
+        end = self.size if length is None else min(self.size, offset + length)
+        if end > start:
+            self.map.madvise(getattr(mmap, advice), start, end - start)
+
+    def will_need(self, offset, length):
+        """Start reading a byte range in the background."""
+        self._advise("MADV_WILLNEED", offset, length)
+
+    def random_access(self):
+        """Turn off the OS's sequential read-ahead for the whole file."""
+        self._advise("MADV_RANDOM")
+
+    def resident_bytes(self):
+        """Bytes of the file currently in this process's memory, or None if
+        the platform cannot tell (only Linux /proc is read)."""
+        mapping = (str(self._inode), os.path.realpath(self.path))
+        resident = 0
+        matched = False
+        try:
+            with open("/proc/self/smaps", "r") as f:
+                for line in f:
+                    if line[0].isupper():
+                        # "Rss:   1234 kB" and the other per-mapping fields.
+                        if matched and line.startswith("Rss:"):
+                            resident += int(line.split()[1]) * 1024
+                    else:
+                        # "start-end perms offset dev inode path" opens a mapping.
+                        fields = line.split(None, 5)
+                        matched = len(fields) == 6 and (fields[4], fields[5].rstrip("\n")) == mapping
+        except (OSError, ValueError, IndexError):
+            return None
+        return resident
+
+    def close(self):
+        # Every document reading from the view must be closed by now.
+        self.view.release()
+        self.map.close()
+
 class ConfigManager:
     def __init__(self):
         self.config_path = os.path.join(APP_DIR, "settings.ini")
         self.config = configparser.ConfigParser()
+        self._saved = None
         self._load_or_create_settings()
 
     def _load_or_create_settings(self):
@@ -51,6 +176,7 @@ class ConfigManager:
         if os.path.exists(self.config_path):
             try:
                 self.config.read(self.config_path, encoding="utf-8")
+                self._saved = self._state()
             except Exception:
                 self.config = configparser.ConfigParser()
         
@@ -68,50 +194,733 @@ class ConfigManager:
     def set(self, key, value):
         self.config["General"][key] = str(value)
 
+    def _state(self):
+        return {name: dict(section) for name, section in self.config.items()}
+
     def save(self):
+        """Write settings.ini, unless it already holds exactly these values."""
+        state = self._state()
+        if state == self._saved:
+            return
         with open(self.config_path, "w", encoding="utf-8") as f:
             self.config.write(f)
+        self._saved = state
+
+class EpubArchive:
+    """Reads an EPUB's manifest and spine straight from the zip, without
+    loading item contents until they are asked for."""
+    HTML_TYPES = ("application/xhtml+xml", "text/html")
+
+    def __init__(self, path):
+        # Items are read straight from the map; each read asks the OS for just
+        # that item's bytes instead of relying on sequential read-ahead.
+        self.file = MappedFile(path)
+        self.file.random_access()
+        try:
+            self.zf = zipfile.ZipFile(self.file.map)
+            container = ET.fromstring(self.read("META-INF/container.xml"))
+            rootfile = container.find(".//{*}rootfile")
+            opf_path = rootfile.get("full-path")
+            opf = ET.fromstring(self.read(opf_path))
+        except Exception:
+            self.file.close()
+            raise ValueError("Not a valid EPUB file")
+
+        opf_dir = posixpath.dirname(opf_path)
+        self.manifest = {}
+        for item in opf.iterfind("{*}manifest/{*}item"):
+            href = unquote(item.get("href", ""))
+            name = posixpath.normpath(posixpath.join(opf_dir, href))
+            self.manifest[item.get("id")] = (name, item.get("media-type", ""))
+
+        self.spine = []
+        for ref in opf.iterfind("{*}spine/{*}itemref"):
+            entry = self.manifest.get(ref.get("idref"))
+            if entry and entry[1] in self.HTML_TYPES:
+                self.spine.append(entry[0])
+
+    def read(self, name):
+        """Return the bytes of an archive member; raises KeyError if missing."""
+        info = self.zf.getinfo(name)
+        self.file.will_need(info.header_offset, ZIP_HEADER_READAHEAD + info.compress_size)
+        return self.zf.read(info)
+
+    def size(self, name):
+        """Uncompressed size of an archive member, or 0 if missing."""
+        try:
+            return self.zf.getinfo(name).file_size
+        except KeyError:
+            return 0
+
+    def close(self):
+        self.zf.close()
+        self.file.close()
+
+class _GlyphAdvances(dict):
+    """Character -> advance width at a font size, filled on first use."""
+    def __init__(self, font, size):
+        super().__init__()
+        self.font = font
+        self.size = size
+
+    def __missing__(self, char):
+        width = self[char] = self.font.glyph_advance(ord(char)) * self.size
+        return width
+
+class PdfStreamWriter:
+    """Writes PDF objects straight to a file as they are produced.
+
+    Pages go out as soon as they are added; the page tree, catalog and
+    xref table follow in close(). Only one offset per object is kept.
+    Object 1 is the catalog, 2 the page tree and 3 is free for a resource
+    that subclasses write last (such as a font).
+    """
+    def __init__(self, path):
+        self.page_count = 0
+        self._offsets = {}
+        self._page_ids = []
+        self._next_id = 4
+        self._file = open(path, "wb")
+        self._file.write(b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _new_id(self):
+        self._next_id += 1
+        return self._next_id - 1
+
+    def _write_object(self, obj_id, body, stream=None):
+        self._offsets[obj_id] = self._file.tell()
+        self._file.write(b"%d 0 obj\n" % obj_id)
+        if stream is None:
+            self._file.write(body.encode("latin-1") + b"\nendobj\n")
+        else:
+            self._file.write(body.encode("latin-1") + b"\nstream\n" + stream + b"\nendstream\nendobj\n")
+
+    def _add_page(self, width, height, resources, content):
+        stream = zlib.compress(content)
+        content_id, page_id = self._new_id(), self._new_id()
+        self._write_object(content_id, f"<< /Length {len(stream)} /Filter /FlateDecode >>", stream)
+        self._write_object(page_id, (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {width:g} {height:g}] "
+            f"/Resources {resources} /Contents {content_id} 0 R >>"))
+        self._page_ids.append(page_id)
+        self.page_count += 1
+
+    def close(self):
+        if self._file is None:
+            return
+        kids = " ".join(f"{i} 0 R" for i in self._page_ids)
+        self._write_object(2, f"<< /Type /Pages /Kids [{kids}] /Count {self.page_count} >>")
+        self._write_object(1, "<< /Type /Catalog /Pages 2 0 R >>")
+        xref = self._file.tell()
+        size = self._next_id
+        rows = [b"xref\n0 %d\n0000000000 65535 f \n" % size]
+        for obj_id in range(1, size):
+            offset = self._offsets.get(obj_id)
+            rows.append(b"%010d 00000 n \n" % offset if offset is not None else b"0000000000 65535 f \n")
+        self._file.write(b"".join(rows))
+        self._file.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (size, xref))
+        self._file.close()
+        self._file = None
+
+class TextPdfWriter(PdfStreamWriter):
+    """Flows plain text onto as many PDF pages as it needs, writing each
+    page to disk as soon as it is full.
+
+    Only the page being filled is held in memory. Text is set in a base-14
+    font ("helv", "cour", "tiro"), or in a TrueType/OpenType file embedded
+    whole as an Identity-H CID font when `font_file` is given.
+    """
+    BASE14 = {"helv": "Helvetica", "cour": "Courier", "tiro": "Times-Roman"}
+
+    def __init__(self, path, font="helv", font_file=None, font_size=11,
+                 page_size=(595, 842), margin=50, line_spacing=1.25):
+        super().__init__(path)
+        self.font = fitz.Font(fontfile=font_file) if font_file else fitz.Font(font)
+        self.font_file = font_file
+        self.base_font = self.BASE14.get(font, "Helvetica")
+        self.font_size = font_size
+        self.page_width, self.page_height = page_size
+        self.margin = margin
+        self.leading = font_size * line_spacing
+        self.text_width = self.page_width - 2 * margin
+        self.lines_per_page = max(1, int((self.page_height - 2 * margin - font_size) // self.leading) + 1)
+        self._lines = []
+        self._advances = _GlyphAdvances(self.font, font_size)
+        self._glyphs = {}
+        self._gids = {}
+
+    def add_text(self, text):
+        """Lay out one paragraph (a line of the input), wrapping as needed."""
+        text = text.rstrip("\r\n").expandtabs(4)
+        text = "".join(c for c in text if c >= " ")
+        if not self.font_file:
+            # Base-14 fonts only cover WinAnsi; measure what will be shown.
+            text = text.encode("cp1252", errors="replace").decode("cp1252")
+        for line in self._wrap(text):
+            self._lines.append(self._encode(line))
+            if len(self._lines) >= self.lines_per_page:
+                self._flush_page()
+
+    def _measure(self, text):
+        return sum(map(self._advances.__getitem__, text))
+
+    def _wrap(self, text):
+        limit = self.text_width
+        if self._measure(text) <= limit:
+            yield text
+            return
+        space = self._advances[" "]
+        line, line_width = "", 0.0
+        for word in text.split(" "):
+            word_width = self._measure(word)
+            if line and line_width + space + word_width <= limit:
+                line, line_width = f"{line} {word}", line_width + space + word_width
+                continue
+            if line:
+                yield line
+            # A word wider than the column is broken between characters.
+            while word_width > limit:
+                cut, cut_width = 0, 0.0
+                for c in word:
+                    if cut and cut_width + self._advances[c] > limit:
+                        break
+                    cut, cut_width = cut + 1, cut_width + self._advances[c]
+                yield word[:cut]
+                word = word[cut:]
+                word_width = self._measure(word)
+            line, line_width = word, word_width
+        yield line
+
+    def _encode(self, line):
+        if not self.font_file:
+            data = line.encode("cp1252", errors="replace")
+            return b"(" + data.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)") + b")"
+        gids = []
+        for c in line:
+            gid = self._gids.get(c)
+            if gid is None:
+                gid = self._gids[c] = self.font.has_glyph(ord(c))
+                self._glyphs.setdefault(gid, c)
+            gids.append(gid)
+        return b"<" + "".join("%04X" % g for g in gids).encode() + b">"
+
+    def _flush_page(self):
+        if not self._lines and self.page_count:
+            return
+        top = self.page_height - self.margin - self.font_size
+        content = [b"BT /F1 %g Tf %g TL %g %g Td" % (self.font_size, self.leading, self.margin, top)]
+        for i, line in enumerate(self._lines):
+            content.append(line + (b" Tj" if i == 0 else b" '"))
+        content.append(b"ET")
+        self._lines = []
+        self._add_page(self.page_width, self.page_height, "<< /Font << /F1 3 0 R >> >>", b"\n".join(content))
+
+    def _write_font(self):
+        if not self.font_file:
+            self._write_object(3, f"<< /Type /Font /Subtype /Type1 /BaseFont /{self.base_font} /Encoding /WinAnsiEncoding >>")
+            return
+        name = "".join(c for c in self.font.name if c.isalnum() or c in "-_") or "EmbeddedFont"
+        with open(self.font_file, "rb") as f:
+            raw = f.read()
+        file_id, desc_id, cid_id, cmap_id = self._new_id(), self._new_id(), self._new_id(), self._new_id()
+        data = zlib.compress(raw)
+        if raw[:4] == b"OTTO":
+            file_key = "FontFile3"
+            self._write_object(file_id, f"<< /Length {len(data)} /Subtype /OpenType /Filter /FlateDecode >>", data)
+        else:
+            file_key = "FontFile2"
+            self._write_object(file_id, f"<< /Length {len(data)} /Length1 {len(raw)} /Filter /FlateDecode >>", data)
+        bbox = self.font.bbox
+        self._write_object(desc_id, (
+            f"<< /Type /FontDescriptor /FontName /{name} /Flags 32 "
+            f"/FontBBox [{bbox.x0 * 1000:.0f} {bbox.y0 * 1000:.0f} {bbox.x1 * 1000:.0f} {bbox.y1 * 1000:.0f}] "
+            f"/ItalicAngle 0 /Ascent {self.font.ascender * 1000:.0f} /Descent {self.font.descender * 1000:.0f} "
+            f"/CapHeight {self.font.ascender * 1000:.0f} /StemV 80 /{file_key} {file_id} 0 R >>"))
+        widths = " ".join(f"{gid} [{self.font.glyph_advance(ord(c)) * 1000:.0f}]" for gid, c in sorted(self._glyphs.items()))
+        self._write_object(cid_id, (
+            f"<< /Type /Font /Subtype /CIDFontType2 /BaseFont /{name} "
+            f"/CIDSystemInfo << /Registry (Adobe) /Ordering (Identity) /Supplement 0 >> "
+            f"/FontDescriptor {desc_id} 0 R /CIDToGIDMap /Identity /W [{widths}] >>"))
+        entries = sorted(self._glyphs.items())
+        cmap = ["/CIDInit /ProcSet findresource begin 12 dict begin begincmap",
+                "/CIDSystemInfo << /Registry (Adobe) /Ordering (UCS) /Supplement 0 >> def",
+                "/CMapName /Adobe-Identity-UCS def /CMapType 2 def",
+                "1 begincodespacerange <0000> <FFFF> endcodespacerange"]
+        for start in range(0, len(entries), 100):
+            block = entries[start:start + 100]
+            cmap.append(f"{len(block)} beginbfchar")
+            cmap.extend("<%04X> <%s>" % (gid, c.encode("utf-16-be").hex().upper()) for gid, c in block)
+            cmap.append("endbfchar")
+        cmap.append("endcmap CMapName currentdict /CMap defineresource pop end end")
+        data = zlib.compress("\n".join(cmap).encode())
+        self._write_object(cmap_id, f"<< /Length {len(data)} /Filter /FlateDecode >>", data)
+        self._write_object(3, (
+            f"<< /Type /Font /Subtype /Type0 /BaseFont /{name} /Encoding /Identity-H "
+            f"/DescendantFonts [{cid_id} 0 R] /ToUnicode {cmap_id} 0 R >>"))
+
+    def close(self):
+        if self._file is None:
+            return
+        if self._lines or not self.page_count:
+            self._flush_page()
+        self._write_font()
+        super().close()
+
+def _embeddable_image(data):
+    """(width, height, components, entries, payload) for an 8-bit gray/RGB
+    PNG or JPEG that PDF can hold without decoding, else None."""
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        pos, header, chunks = 8, None, []
+        while pos + 8 <= len(data):
+            length, kind = struct.unpack(">I4s", data[pos:pos + 8])
+            body = data[pos + 8:pos + 8 + length]
+            if kind == b"IHDR":
+                header = struct.unpack(">IIBBBBB", body[:13])
+            elif kind == b"IDAT":
+                chunks.append(body)
+            elif kind == b"IEND":
+                break
+            pos += 12 + length
+        if header is None or header[2] != 8 or header[3] not in (0, 2) or header[6] != 0:
+            return None
+        width, height, components = header[0], header[1], 1 if header[3] == 0 else 3
+        # PNG's IDAT stream is Flate with per-row predictors, which PDF understands.
+        entries = (f"/Filter /FlateDecode /DecodeParms << /Predictor 15 /Colors {components} "
+                   f"/BitsPerComponent 8 /Columns {width} >>")
+        return width, height, components, entries, b"".join(chunks)
+    if data[:2] == b"\xff\xd8":
+        pos = 2
+        while pos + 4 <= len(data) and data[pos] == 0xFF:
+            marker = data[pos + 1]
+            if marker == 0xFF:
+                pos += 1
+                continue
+            if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                bits, height, width, components = struct.unpack(">BHHB", data[pos + 4:pos + 10])
+                if bits != 8 or components not in (1, 3):
+                    return None
+                return width, height, components, "/Filter /DCTDecode", data
+            pos += 2 + struct.unpack(">H", data[pos + 2:pos + 4])[0]
+    return None
+
+_TRANSLUCENT = re.compile(rb"[\x01-\xfe]+")
+
+def _split_alpha(pix):
+    """(colour pixmap, alpha bytes) for a pixmap with alpha. MuPDF keeps
+    colour premultiplied; PDF wants it straight, with the alpha as a soft mask."""
+    n, colours = pix.n, pix.n - 1
+    samples = pix.samples
+    if pix.stride != pix.width * n:
+        samples = b"".join(samples[y * pix.stride:y * pix.stride + pix.width * n] for y in range(pix.height))
+    alpha = samples[colours::n]
+    if numpy is not None:
+        px = numpy.frombuffer(samples, numpy.uint8).reshape(-1, n)
+        a = px[:, colours:].astype(numpy.uint32)
+        straight = (px[:, :colours] * numpy.uint32(255) + a // 2) // numpy.maximum(a, 1)
+        colour = numpy.minimum(straight, 255).astype(numpy.uint8).tobytes()
+    else:
+        colour = bytearray(len(alpha) * colours)
+        for c in range(colours):
+            colour[c::colours] = samples[c::n]
+        # Opaque and fully clear pixels need nothing, so only runs in between are visited.
+        for run in _TRANSLUCENT.finditer(alpha):
+            for i in range(run.start(), run.end()):
+                a = alpha[i]
+                for j in range(i * colours, i * colours + colours):
+                    colour[j] = min(255, (colour[j] * 255 + a // 2) // a)
+    return fitz.Pixmap(pix.colorspace, pix.width, pix.height, bytes(colour), 0), alpha
+
+def encode_image_for_pdf(path, dpi=None, jpeg_quality=None, bilevel=False):
+    """Encode one image as a PDF image stream.
+
+    Runs in worker processes. Plain PNG and JPEG files are embedded
+    without decoding. Images above `dpi` are downscaled; with
+    `jpeg_quality` they are re-encoded as JPEG, with `bilevel` as 1-bit
+    black and white. Returns (width_pt, height_pt, image dict entries,
+    data, soft mask data).
+    """
+    with fitz.open(path) as img_doc:
+        rect = img_doc[0].rect
+    width_pt, height_pt = rect.width, rect.height
+    if not (jpeg_quality or bilevel):
+        with open(path, "rb") as f:
+            embeddable = _embeddable_image(f.read())
+        if embeddable and not (dpi and embeddable[0] * 72 / width_pt > dpi):
+            width, height, components, entries, data = embeddable
+            space = "/DeviceGray" if components == 1 else "/DeviceRGB"
+            return (width_pt, height_pt,
+                    f"/Width {width} /Height {height} /ColorSpace {space} /BitsPerComponent 8 {entries}", data, None)
+    pix = fitz.Pixmap(path)
+    if dpi and pix.width * 72 / width_pt > dpi:
+        pix = fitz.Pixmap(pix, max(1, round(width_pt * dpi / 72)), max(1, round(height_pt * dpi / 72)), None)
+    if pix.colorspace is None or pix.colorspace.n not in (1, 3):
+        pix = fitz.Pixmap(fitz.csRGB, pix)
+    smask = None
+    if pix.alpha:
+        pix, alpha = _split_alpha(pix)
+        smask = zlib.compress(alpha)
+    size = f"/Width {pix.width} /Height {pix.height}"
+    if bilevel:
+        if pix.n != 1:
+            pix = fitz.Pixmap(fitz.csGRAY, pix)
+        # Thresholded rows become strings of 0/1 digits that int() packs at C speed.
+        table = bytes(48 if v < BILEVEL_THRESHOLD else 49 for v in range(256))
+        width, stride, samples = pix.width, pix.stride, pix.samples
+        pad = b"1" * (-width % 8)
+        row_bytes = (width + len(pad)) // 8
+        rows = [int(samples[y * stride:y * stride + width].translate(table) + pad, 2).to_bytes(row_bytes, "big")
+                for y in range(pix.height)]
+        return (width_pt, height_pt, f"{size} /ColorSpace /DeviceGray /BitsPerComponent 1 /Filter /FlateDecode",
+                zlib.compress(b"".join(rows)), None)
+    space = "/DeviceGray" if pix.n == 1 else "/DeviceRGB"
+    if jpeg_quality:
+        return (width_pt, height_pt, f"{size} /ColorSpace {space} /BitsPerComponent 8 /Filter /DCTDecode",
+                pix.tobytes("jpeg", jpg_quality=jpeg_quality), smask)
+    return (width_pt, height_pt, f"{size} /ColorSpace {space} /BitsPerComponent 8 /Filter /FlateDecode",
+            zlib.compress(pix.samples), smask)
+
+class ImagePdfWriter(PdfStreamWriter):
+    """Writes one page per image, each sized to its image, as images arrive."""
+    def add_image(self, width_pt, height_pt, entries, data, smask=None):
+        image_id = self._new_id()
+        if smask is not None:
+            mask_id = self._new_id()
+            size = entries.split(" /ColorSpace")[0]
+            self._write_object(mask_id, (
+                f"<< /Type /XObject /Subtype /Image {size} /ColorSpace /DeviceGray /BitsPerComponent 8 "
+                f"/Filter /FlateDecode /Length {len(smask)} >>"), smask)
+            entries += f" /SMask {mask_id} 0 R"
+        self._write_object(image_id, f"<< /Type /XObject /Subtype /Image {entries} /Length {len(data)} >>", data)
+        content = b"q %g 0 0 %g 0 0 cm /Im0 Do Q" % (width_pt, height_pt)
+        self._add_page(width_pt, height_pt, f"<< /XObject << /Im0 {image_id} 0 R >> >>", content)
+
+_extract_handles = {}
+
+def _extract_handle(path, opener):
+    """This process's own handle on `path`, kept open across its tasks."""
+    handle = _extract_handles.get(path)
+    if handle is None:
+        _close_extract_handles()
+        handle = _extract_handles[path] = opener(path)
+    return handle
+
+def _close_extract_handles():
+    for handle in _extract_handles.values():
+        handle.close()
+    _extract_handles.clear()
+
+def _page_markdown(page):
+    """Markdown for one page: larger-than-body lines become headings,
+    all-bold blocks become bold paragraphs."""
+    blocks = [b for b in page.get_text("dict", flags=fitz.TEXTFLAGS_TEXT)["blocks"] if b["type"] == 0]
+    sizes = Counter()
+    for block in blocks:
+        for line in block["lines"]:
+            for span in line["spans"]:
+                sizes[round(span["size"])] += len(span["text"])
+    if not sizes:
+        return ""
+    body = sizes.most_common(1)[0][0]
+    parts = []
+    for block in blocks:
+        spans = [span for line in block["lines"] for span in line["spans"] if span["text"].strip()]
+        text = " ".join(" ".join(span["text"] for span in line["spans"]).strip() for line in block["lines"]).strip()
+        if not spans or not text:
+            continue
+        size = max(span["size"] for span in spans)
+        if size >= body * 1.15:
+            level = 1 if size >= body * 1.6 else 2 if size >= body * 1.3 else 3
+            parts.append("#" * level + " " + " ".join(text.split()))
+        elif all(span["flags"] & fitz.TEXT_FONT_BOLD for span in spans):
+            parts.append(f"**{text}**")
+        else:
+            parts.append(text)
+    return "\n\n".join(parts)
+
+def extract_pdf_pages(path, page_range, markdown=False):
+    """Text of pages [start, stop) of a PDF, one string per page.
+
+    Runs in worker processes. Plain text pages end with a form feed, as
+    pdftotext writes them.
+    """
+    doc = _extract_handle(path, fitz.open)
+    pages = []
+    for index in range(*page_range):
+        page = doc.load_page(index)
+        if markdown:
+            text = _page_markdown(page)
+            pages.append(text + "\n\n" if text else "")
+        else:
+            pages.append(page.get_text() + "\f")
+    return pages
+
+def extract_epub_items(path, item_range):
+    """Plain text of spine items [start, stop) of an EPUB, one string per item."""
+    archive = _extract_handle(path, EpubArchive)
+    items = []
+    for name in archive.spine[slice(*item_range)]:
+        try:
+            soup = bs4.BeautifulSoup(archive.read(name), "html.parser")
+        except KeyError:
+            continue
+        for tag in soup(["script", "style"]):
+            tag.decompose()
+        lines = (line.strip() for line in (soup.body or soup).get_text().splitlines())
+        text = re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
+        if text:
+            items.append(text + "\n\n")
+    return items
+
+class TextEpubWriter:
+    """Streams plain text into an EPUB 3 archive, one bounded chapter at a time.
+
+    A heading line (Markdown "#", "Chapter ...", "บทที่ ...") starts a new
+    chapter; so does reaching `chapter_bytes`. Each chapter is written to
+    the archive as soon as it closes, so only its lines and the chapter
+    titles are held in memory.
+    """
+    # A Markdown heading, or a short line of a keyword, a number (digits,
+    # Thai digits, roman numerals or words) and an optional title.
+    _UNITS = "one|two|three|four|five|six|seven|eight|nine"
+    _NUMBER = (r"(\d+|[๐-๙]+|(?=[mdclxvi])m{0,4}(cm|cd|d?c{0,3})(xc|xl|l?x{0,3})(ix|iv|v?i{0,3})"
+               rf"|(twenty|thirty|forty|fifty|sixty|seventy|eighty|ninety)([- ]({_UNITS}))?"
+               rf"|ten|eleven|twelve|(thir|four|fif|six|seven|eigh|nine)teen|{_UNITS})")
+    HEADING = re.compile(rf"^\s*(#{{1,6}}\s+\S.*|((chapter|part|book)\s+|บทที่\s*){_NUMBER}(?<=\w)\b(\W{{0,3}}\s*\S.{{0,60}})?)\s*$",
+                         re.IGNORECASE)
+    CSS = "p { margin: 0; white-space: pre-wrap; } h2 { margin: 0.5em 0; }"
+
+    def __init__(self, path, title="Untitled", language="en", chapter_bytes=EPUB_CHAPTER_BYTES):
+        self.title = title
+        self.language = language
+        self.chapter_bytes = chapter_bytes
+        self.chapters = []
+        self._lines = []
+        self._size = 0
+        # Chapters split off by size share the last heading, numbered by part.
+        self._run_title = title
+        self._part = 1
+        self._show_heading = False
+        self._zip = zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED)
+        # The mimetype entry must come first and be stored uncompressed.
+        self._zip.writestr(zipfile.ZipInfo("mimetype"), "application/epub+zip", zipfile.ZIP_STORED)
+        self._zip.writestr("META-INF/container.xml", (
+            '<?xml version="1.0" encoding="utf-8"?>\n'
+            '<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">'
+            '<rootfiles><rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/>'
+            '</rootfiles></container>'))
+        self._zip.writestr("OEBPS/style.css", self.CSS)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add_text(self, text):
+        line = text.rstrip("\r\n")
+        if self.HEADING.match(line):
+            self._flush_chapter()
+            self._run_title = line.strip().lstrip("#").strip()
+            self._part = 1
+            self._show_heading = True
+            return
+        encoded = f"<p>{html.escape(line) or '<br/>'}</p>\n"
+        self._lines.append(encoded)
+        self._size += len(encoded)
+        if self._size >= self.chapter_bytes:
+            self._flush_chapter()
+
+    def _flush_chapter(self):
+        if not self._lines and not self._show_heading:
+            return
+        title = self._run_title if self._part == 1 else f"{self._run_title} ({self._part})"
+        name = f"chap_{len(self.chapters) + 1:05d}.xhtml"
+        with self._zip.open(f"OEBPS/{name}", "w") as f:
+            f.write((
+                '<?xml version="1.0" encoding="utf-8"?>\n<!DOCTYPE html>\n'
+                f'<html xmlns="http://www.w3.org/1999/xhtml" xml:lang="{self.language}"><head>'
+                f'<title>{html.escape(title)}</title><link rel="stylesheet" type="text/css" href="style.css"/>'
+                '</head><body>\n'
+                + (f"<h2>{html.escape(title)}</h2>\n" if self._show_heading else "")).encode("utf-8"))
+            for line in self._lines:
+                f.write(line.encode("utf-8"))
+            f.write(b"</body></html>\n")
+        self.chapters.append((name, title))
+        self._lines, self._size = [], 0
+        self._part += 1
+        self._show_heading = False
+
+    def close(self):
+        if self._zip is None:
+            return
+        self._flush_chapter()
+        if not self.chapters:
+            self._show_heading = True
+            self._flush_chapter()
+        items = "".join(
+            f'<item id="c{i}" href="{name}" media-type="application/xhtml+xml"/>'
+            for i, (name, _) in enumerate(self.chapters))
+        spine = "".join(f'<itemref idref="c{i}"/>' for i in range(len(self.chapters)))
+        modified = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        self._zip.writestr("OEBPS/content.opf", (
+            '<?xml version="1.0" encoding="utf-8"?>\n'
+            '<package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="uid">'
+            '<metadata xmlns:dc="http://purl.org/dc/elements/1.1/">'
+            f'<dc:identifier id="uid">urn:uuid:{uuid.uuid4()}</dc:identifier>'
+            f'<dc:title>{html.escape(self.title)}</dc:title><dc:language>{self.language}</dc:language>'
+            f'<meta property="dcterms:modified">{modified}</meta></metadata>'
+            '<manifest><item id="nav" href="nav.xhtml" media-type="application/xhtml+xml" properties="nav"/>'
+            '<item id="ncx" href="toc.ncx" media-type="application/x-dtbncx+xml"/>'
+            f'<item id="css" href="style.css" media-type="text/css"/>{items}</manifest>'
+            f'<spine toc="ncx">{spine}</spine></package>'))
+        links = "".join(f'<li><a href="{name}">{html.escape(title)}</a></li>' for name, title in self.chapters)
+        self._zip.writestr("OEBPS/nav.xhtml", (
+            '<?xml version="1.0" encoding="utf-8"?>\n<!DOCTYPE html>\n'
+            '<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops">'
+            f'<head><title>{html.escape(self.title)}</title></head><body>'
+            f'<nav epub:type="toc" id="toc"><h1>{html.escape(self.title)}</h1><ol>{links}</ol></nav></body></html>'))
+        points = "".join(
+            f'<navPoint id="p{i}" playOrder="{i + 1}"><navLabel><text>{html.escape(title)}</text></navLabel>'
+            f'<content src="{name}"/></navPoint>' for i, (name, title) in enumerate(self.chapters))
+        self._zip.writestr("OEBPS/toc.ncx", (
+            '<?xml version="1.0" encoding="utf-8"?>\n'
+            '<ncx xmlns="http://www.daisy.org/z3986/2005/ncx/" version="2005-1"><head/>'
+            f'<docTitle><text>{html.escape(self.title)}</text></docTitle><navMap>{points}</navMap></ncx>'))
+        self._zip.close()
+        self._zip = None
 
 class ConverterLogic:
     """Handles the actual file conversion logic separated from UI."""
     
     @staticmethod
-    def text_to_pdf(input_path, output_path, password=None):
-        with open(input_path, "r", encoding="utf-8", errors="ignore") as f:
-            text = f.read()
-        doc = fitz.open()
-        page = doc.new_page()
-        rect = fitz.Rect(50, 50, 550, 800)
-        page.insert_textbox(rect, text, fontsize=11, align=0)
-        ConverterLogic._save_doc(doc, output_path, password)
+    @perf.timed("convert")
+    def text_to_pdf(input_path, output_path, password=None, **layout):
+        """Stream a text file onto as many pages as it needs.
+
+        `layout` goes to TextPdfWriter (font, font_file, font_size,
+        page_size, margin, line_spacing). Returns the page count and
+        pages/sec.
+        """
+        start = time.perf_counter()
+        target = output_path + ".tmp" if password else output_path
+        with open(input_path, "r", encoding="utf-8", errors="ignore") as f, TextPdfWriter(target, **layout) as writer:
+            for line in iter(lambda: f.readline(TEXT_READ_CHUNK), ""):
+                writer.add_text(line)
+        if password:
+            ConverterLogic._encrypt_copy(target, output_path, password)
+        elapsed = time.perf_counter() - start
+        return {"pages": writer.page_count, "seconds": elapsed,
+                "pages_per_sec": writer.page_count / elapsed if elapsed else 0.0}
+
+    @staticmethod
+    @perf.timed("convert")
+    def text_to_epub(input_path, output_path, **options):
+        """Stream a text file into an EPUB of bounded, escaped chapters.
+
+        `options` go to TextEpubWriter (title, language, chapter_bytes).
+        Returns the chapter count and seconds spent.
+        """
+        start = time.perf_counter()
+        options.setdefault("title", os.path.basename(input_path))
+        with open(input_path, "r", encoding="utf-8", errors="ignore") as f, TextEpubWriter(output_path, **options) as writer:
+            for line in iter(lambda: f.readline(TEXT_READ_CHUNK), ""):
+                writer.add_text(line)
+        return {"chapters": len(writer.chapters), "seconds": time.perf_counter() - start}
+
+    @staticmethod
+    @perf.timed("convert")
+    def images_to_pdf(input_paths, output_path, password=None, dpi=None, jpeg_quality=None,
+                      bilevel=False, workers=None):
+        """One page per image, decoded and encoded in worker processes.
+
+        Pages are written as soon as their image arrives, in input order, so
+        memory stays bounded whatever the batch size. Returns the image
+        count and images/sec.
+        """
+        start = time.perf_counter()
+        encode = functools.partial(encode_image_for_pdf, dpi=dpi, jpeg_quality=jpeg_quality, bilevel=bilevel)
+        target = output_path + ".tmp" if password else output_path
+        with ImagePdfWriter(target) as writer:
+            for page in ConverterLogic._map_ordered(encode, input_paths, workers):
+                writer.add_image(*page)
+        if password:
+            ConverterLogic._encrypt_copy(target, output_path, password)
+        elapsed = time.perf_counter() - start
+        return {"images": writer.page_count, "seconds": elapsed,
+                "images_per_sec": writer.page_count / elapsed if elapsed else 0.0}
+
+    @staticmethod
+    @perf.timed("convert")
+    def pdf_to_text(input_path, output_path, markdown=False, workers=None):
+        """Extract a PDF's text as plain text or Markdown.
+
+        Page ranges are spread over worker processes and written in page
+        order as they finish. Returns the page count and pages/sec.
+        """
+        start = time.perf_counter()
+        with fitz.open(input_path) as doc:
+            if doc.needs_pass:
+                raise ValueError("PDF is password protected")
+            count = doc.page_count
+        extract = functools.partial(extract_pdf_pages, input_path, markdown=markdown)
+        ConverterLogic._write_extracted(extract, count, PDF_PAGES_PER_TASK, output_path, workers)
+        elapsed = time.perf_counter() - start
+        return {"pages": count, "seconds": elapsed, "pages_per_sec": count / elapsed if elapsed else 0.0}
+
+    @staticmethod
+    @perf.timed("convert")
+    def epub_to_text(input_path, output_path, workers=None):
+        """Extract an EPUB's chapters as plain text, in spine order.
+
+        Returns the chapter count and seconds spent.
+        """
+        start = time.perf_counter()
+        archive = EpubArchive(input_path)
+        count = len(archive.spine)
+        archive.close()
+        extract = functools.partial(extract_epub_items, input_path)
+        ConverterLogic._write_extracted(extract, count, EPUB_ITEMS_PER_TASK, output_path, workers)
+        return {"chapters": count, "seconds": time.perf_counter() - start}
+
+    @staticmethod
+    def _write_extracted(extract, count, per_task, output_path, workers):
+        ranges = [(i, min(i + per_task, count)) for i in range(0, count, per_task)]
+        try:
+            with open(output_path, "w", encoding="utf-8") as out:
+                for texts in ConverterLogic._map_ordered(extract, ranges, workers):
+                    out.writelines(texts)
+        finally:
+            # Extraction that ran in this process leaves its handle open.
+            _close_extract_handles()
 
     @staticmethod
-    def text_to_epub(input_path, output_path):
-        with open(input_path, "r", encoding="utf-8", errors="ignore") as f:
-            text = f.read()
-        book = epub.EpubBook()
-        book.set_identifier("fereader-convert")
-        book.set_title(os.path.basename(input_path))
-        book.set_language("en")
-        chapter = epub.EpubHtml(title="Chapter 1", file_name="chap_1.xhtml", lang="en")
-        chapter.content = f"<html><body><pre>{text}</pre></body></html>"
-        book.add_item(chapter)
-        book.toc = (chapter,)
-        book.add_item(epub.EpubNcx())
-        book.add_item(epub.EpubNav())
-        book.spine = ["nav", chapter]
-        epub.write_epub(output_path, book)
+    def _map_ordered(fn, items, workers=None):
+        """Like map() over a process pool, with at most two jobs per worker in flight."""
+        workers = workers or os.cpu_count() or 1
+        if workers == 1 or len(items) < 2:
+            yield from map(fn, items)
+            return
+        # Spawned, not forked: the UI calls this with Qt's threads running.
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            pending = []
+            for item in items:
+                pending.append(pool.submit(fn, item))
+                if len(pending) >= 2 * workers:
+                    yield pending.pop(0).result()
+            for future in pending:
+                yield future.result()
 
     @staticmethod
-    def images_to_pdf(input_paths, output_path, password=None):
-        doc = fitz.open()
-        for img_path in input_paths:
-            img_doc = fitz.open(img_path)
-            rect = img_doc[0].rect
-            page = doc.new_page(width=rect.width, height=rect.height)
-            page.insert_image(rect, filename=img_path)
-            img_doc.close()
-        ConverterLogic._save_doc(doc, output_path, password)
+    def _encrypt_copy(source, output_path, password):
+        # The streaming writers cannot encrypt, so protected output takes a second pass.
+        ConverterLogic._save_doc(fitz.open(source), output_path, password)
+        os.remove(source)
 
     @staticmethod
     def _save_doc(doc, path, password):
@@ -0,0 +1,129 @@
+"""Timing spans for the load, render and convert paths.
+
+    with perf.span("rasterise", page=3):
+        ...
+
+Finished spans are handed to every registered sink as a dict with the
+span name, duration in ms, wall-clock timestamp, thread name and any
+extra fields. With no sink registered a span only reads the clock.
+Setting FEREADER_TRACE=trace.jsonl makes the app append every span to
+that file.
+"""
+import os
+import sys
+import json
+import time
+import functools
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+RING_CAPACITY = 2000
+
+_sinks = []
+
+def add_sink(sink):
+    """Register an object with a write(record) method."""
+    _sinks.append(sink)
+
+def remove_sink(sink):
+    if sink in _sinks:
+        _sinks.remove(sink)
+
+def emit(name, ms, **fields):
+    """Send a finished span to the sinks."""
+    if not _sinks:
+        return
+    record = {"name": name, "ms": round(ms, 3), "ts": time.time(),
+              "thread": threading.current_thread().name, **fields}
+    for sink in list(_sinks):
+        try:
+            sink.write(record)
+        except Exception as e:
+            print(f"Trace Error: {e}")
+
+@contextmanager
+def span(name, **fields):
+    """Time the block; fields added to the yielded dict are recorded too."""
+    start = time.perf_counter()
+    try:
+        yield fields
+    except Exception as e:
+        fields["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        if _sinks:
+            emit(name, (time.perf_counter() - start) * 1000, **fields)
+
+def timed(name):
+    """Decorator form of span(); records the function name as `fn`."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name, fn=func.__name__):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+class RingBufferSink:
+    """Keeps the most recent spans in memory."""
+    def __init__(self, capacity=RING_CAPACITY):
+        self.records = deque(maxlen=capacity)
+
+    def write(self, record):
+        self.records.append(record)
+
+    def last(self, name):
+        for record in reversed(list(self.records)):
+            if record["name"] == name:
+                return record
+        return None
+
+    def summary(self):
+        """Per span name: count, average and worst ms over the buffer."""
+        stats = {}
+        for record in list(self.records):
+            entry = stats.setdefault(record["name"], {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+            entry["count"] += 1
+            entry["total_ms"] += record["ms"]
+            entry["max_ms"] = max(entry["max_ms"], record["ms"])
+        return {name: {"count": e["count"], "avg_ms": e["total_ms"] / e["count"], "max_ms": e["max_ms"]}
+                for name, e in stats.items()}
+
+class JsonLinesSink:
+    """Appends one JSON object per span to a file."""
+    def __init__(self, path):
+        self._file = open(path, "a", encoding="utf-8", buffering=1)
+        self._lock = threading.Lock()
+
+    def write(self, record):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._file.write(line)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+def rss_mb():
+    """Current resident memory of this process in MB, or None if unknown."""
+    if sys.platform == "win32":
+        import ctypes
+        from ctypes import wintypes
+
+        class Counters(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD)] + [
+                (field, ctypes.c_size_t) for field in (
+                    "PeakWorkingSetSize", "WorkingSetSize", "QuotaPeakPagedPoolUsage", "QuotaPagedPoolUsage",
+                    "QuotaPeakNonPagedPoolUsage", "QuotaNonPagedPoolUsage", "PagefileUsage", "PeakPagefileUsage")]
+        counters = Counters()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if not ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return None
+        return counters.WorkingSetSize / 2 ** 20
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError, IndexError):
+        return None
@@ -1,127 +1,1032 @@
 import os
-import shutil
-import tempfile
+import importlib.util
 import posixpath
-import fitz 
-import ebooklib
-from ebooklib import epub
-from bs4 import BeautifulSoup
-from PySide6.QtGui import QImage, QPixmap, QPainter
-from PySide6.QtCore import Qt, QUrl
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from PySide6.QtGui import QImage, QPixmap, QTextDocument, QFont
+from PySide6.QtCore import Qt, QByteArray, QSizeF, QPointF
+
+import module
+import perf
+
+fitz = module.LazyModule("fitz")
+# Optional: without it night mode uses MuPDF's own luminance inversion.
+numpy = module.LazyModule("numpy") if importlib.util.find_spec("numpy") else None
+
+DEFAULT_CACHE_BUDGET = 256 * 1024 * 1024
+PREFETCH_DISTANCE = 2
+CHAPTER_CACHE_BUDGET = 32 * 1024 * 1024
+RESOURCE_CACHE_BUDGET = 64 * 1024 * 1024
+DISPLAY_LIST_BUDGET = 128 * 1024 * 1024
+RENDER_BAND_HEIGHT = 256
+TILE_SIZE = 512
+TILED_ZOOM_THRESHOLD = 3.0
+DISK_CACHE_DIR = os.path.join(module.APP_DIR, "page_cache")
+DISK_CACHE_BUDGET = 512 * 1024 * 1024
+THUMBNAIL_WIDTH = 160
+LAYOUT_CACHE_BUDGET = 64 * 1024 * 1024
+EPUB_PAGE_MARGIN = 24
+# MuPDF starts at the xref and trailer at the end of the file.
+PDF_TAIL_READAHEAD = 1024 * 1024
+# In night mode a picture covering more of the page than this is a scan,
+# so it is darkened with the page rather than kept.
+PAGE_IMAGE_COVERAGE = 0.9
+
+def invert_lightness(pix, keep=()):
+    """Invert the lightness of an RGB(A) pixmap in place, keeping hue and
+    saturation: every channel moves by 255 - (max + min), so white paper
+    turns black while red text stays red. Areas in `keep` (IRects in the
+    pixmap's coordinates) come out unchanged."""
+    saved = []
+    for rect in keep:
+        rect = fitz.IRect(rect) & pix.irect
+        if not rect.is_empty:
+            copy = fitz.Pixmap(pix.colorspace, rect, pix.alpha)
+            copy.copy(pix, rect)
+            saved.append((rect, copy))
+    if numpy is None:
+        fitz.mupdf.fz_invert_pixmap_luminance(pix.this)
+    else:
+        rows = numpy.frombuffer(pix.samples_mv, numpy.uint8).reshape(pix.height, pix.stride)
+        px = rows[:, :pix.width * pix.n].reshape(pix.height, pix.width, pix.n)
+        r, g, b = px[..., 0], px[..., 1], px[..., 2]
+        # Exact in uint8: the result always lies between 0 and the pixel's
+        # alpha, so wrapping intermediate values cancel out.
+        shift = numpy.maximum(r, g)
+        numpy.maximum(shift, b, out=shift)
+        low = numpy.minimum(r, g)
+        numpy.minimum(low, b, out=low)
+        numpy.subtract(px[..., 3] if pix.alpha else 255, shift, out=shift)
+        shift -= low
+        r += shift
+        g += shift
+        b += shift
+    for rect, copy in saved:
+        pix.copy(copy, rect)
+
+class LoadCancelled(Exception):
+    """Raised inside a loader when its cancel check returns True."""
+
+class LRUCache:
+    """Thread-safe least-recently-used map bounded by a byte budget."""
+
+    def __init__(self, budget_bytes, sizeof):
+        self.budget_bytes = budget_bytes
+        self._sizeof = sizeof
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def get(self, key):
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        size = self._sizeof(value)
+        if size > self.budget_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old[1]
+            self._items[key] = (value, size)
+            self.current_bytes += size
+            while self.current_bytes > self.budget_bytes:
+                _, (_, evicted_size) = self._items.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._items), "bytes": self.current_bytes,
+            "budget": self.budget_bytes, "hits": self.hits, "misses": self.misses,
+            "evictions": self.evictions, "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+class DiskCache:
+    """Size-capped directory of zlib-compressed rendered images.
+
+    One directory is shared by every book, so eviction is least recently
+    used across books; a read refreshes the file's mtime, which is what
+    the next session's scan orders by. Writes go through a background
+    thread.
+    """
+    HEADER = struct.Struct("<4sIIII")
+    MAGIC = b"FEPC"
+
+    def __init__(self, directory=DISK_CACHE_DIR, budget_bytes=DISK_CACHE_BUDGET):
+        self.directory = directory
+        self.budget_bytes = budget_bytes
+        self.current_bytes = 0
+        self._files = None
+        self._lock = threading.Lock()
+        self._writer = None
+
+    def _index(self):
+        # Scanned on first use rather than at startup; call with _lock held.
+        if self._files is None:
+            self._files = {}
+            os.makedirs(self.directory, exist_ok=True)
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(".page"):
+                    st = entry.stat()
+                    self._files[entry.name] = [st.st_size, st.st_mtime]
+            self.current_bytes = sum(size for size, _ in self._files.values())
+        return self._files
+
+    def __contains__(self, name):
+        with self._lock:
+            return name in self._index()
+
+    def get(self, name):
+        with self._lock:
+            entry = self._index().get(name)
+            if entry is None:
+                return None
+            entry[1] = time.time()
+        path = os.path.join(self.directory, name)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            magic, width, height, stride, fmt = self.HEADER.unpack_from(data)
+            if magic != self.MAGIC:
+                raise ValueError("bad header")
+            samples = zlib.decompress(memoryview(data)[self.HEADER.size:])
+            os.utime(path)
+        except (OSError, ValueError, struct.error, zlib.error) as e:
+            print(f"Disk Cache Error: {e}")
+            self._remove(name)
+            return None
+        img = QImage(samples, width, height, stride, QImage.Format(fmt))
+        img.buffer_owner = samples
+        return img
+
+    def put(self, name, img):
+        with self._lock:
+            if self._writer is None:
+                self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fereader_disk")
+            writer = self._writer
+        return writer.submit(self._write, name, img)
+
+    def _write(self, name, img):
+        header = self.HEADER.pack(self.MAGIC, img.width(), img.height(), img.bytesPerLine(), img.format().value)
+        data = header + zlib.compress(img.constBits(), 1)
+        path = os.path.join(self.directory, name)
+        try:
+            with self._lock:
+                self._index()
+            with open(path + ".tmp", "wb") as f:
+                f.write(data)
+            os.replace(path + ".tmp", path)
+        except OSError as e:
+            print(f"Disk Cache Error: {e}")
+            return
+        with self._lock:
+            old = self._files.pop(name, None)
+            if old is not None:
+                self.current_bytes -= old[0]
+            self._files[name] = [len(data), time.time()]
+            self.current_bytes += len(data)
+            if self.current_bytes <= self.budget_bytes:
+                return
+            victims = sorted(self._files, key=lambda n: self._files[n][1])
+        for victim in victims:
+            if self.current_bytes <= self.budget_bytes:
+                break
+            self._remove(victim)
+
+    def _remove(self, name):
+        with self._lock:
+            entry = self._files.pop(name, None)
+            if entry is not None:
+                self.current_bytes -= entry[0]
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except OSError:
+            pass
+
+    def close(self):
+        """Finish pending writes."""
+        with self._lock:
+            writer, self._writer = self._writer, None
+        if writer is not None:
+            writer.shutdown(wait=True)
+
+class _ChapterDocument(QTextDocument):
+    """A chapter's QTextDocument whose relative links load from the EPUB."""
+    def __init__(self, engine, index):
+        super().__init__()
+        self._engine = engine
+        self._index = index
+
+    def loadResource(self, type, url):
+        if url.isRelative():
+            data = self._engine.get_epub_resource(self._index, url.path())
+            if data is not None:
+                return QByteArray(data)
+        return super().loadResource(type, url)
+
+class EpubPaginator:
+    """Lays EPUB chapters out into screen-sized pages.
+
+    Each chapter is laid out once per (font, size, page size) and the
+    QTextDocument kept in an LRU, so turning pages only paints. Page counts
+    are kept apart from the documents; chapters not counted yet are
+    estimated from their size until count_next() reaches them.
+    """
+    def __init__(self, engine, budget_bytes=LAYOUT_CACHE_BUDGET):
+        self.engine = engine
+        # QTextDocument sizes are not exposed; ~32 bytes per character
+        # covers the text, formats and line layout.
+        self.documents = LRUCache(budget_bytes, lambda doc: doc.characterCount() * 32)
+        self.params = None
+        self.page_counts = {}
+        # Counts per params, so going back to an earlier font or size does not count again.
+        self._counts = {}
+        self._bytes_per_page = None
+
+    def configure(self, family, size, width, height):
+        """Set the font and page size; returns True if pages changed."""
+        params = (family, int(size), max(200, int(width)), max(200, int(height)))
+        if params == self.params:
+            return False
+        # Documents stay cached under their old params, so switching back is free.
+        self.params = params
+        self.page_counts = self._counts.setdefault(params, {})
+        self._bytes_per_page = None
+        return True
+
+    def clear(self):
+        self.documents.clear()
+        self.page_counts = {}
+        self._counts = {}
+        self._bytes_per_page = None
+        self.params = None
+
+    @property
+    def page_height(self):
+        return self.params[3]
+
+    def _layout(self, index):
+        family, size, width, height = self.params
+        with perf.span("paginate", chapter=index) as fields:
+            doc = _ChapterDocument(self.engine, index)
+            doc.setDefaultFont(QFont(family, size))
+            doc.setDocumentMargin(EPUB_PAGE_MARGIN)
+            doc.setHtml(self.engine.get_epub_html(index))
+            doc.setPageSize(QSizeF(width, height))
+            fields["pages"] = self.page_counts[index] = max(1, doc.pageCount())
+        self._bytes_per_page = None
+        return doc
+
+    def document(self, index):
+        """The laid-out document of a chapter, from the cache if possible."""
+        key = (index,) + self.params
+        doc = self.documents.get(key)
+        if doc is None:
+            doc = self._layout(index)
+            self.documents.put(key, doc)
+        else:
+            self.page_counts[index] = max(1, doc.pageCount())
+        return doc
+
+    def count_next(self):
+        """Count the pages of one more chapter; False once all are counted."""
+        for index in range(len(self.engine.pages)):
+            if index not in self.page_counts:
+                # Only the count is wanted; the document is not cached.
+                self._layout(index)
+                return True
+        return False
+
+    @property
+    def exact(self):
+        return len(self.page_counts) >= len(self.engine.pages)
+
+    def page_count(self, index):
+        count = self.page_counts.get(index)
+        if count is None:
+            if self._bytes_per_page is None:
+                self._bytes_per_page = self._estimate_bytes_per_page()
+            count = max(1, round(self._chapter_bytes(index) / self._bytes_per_page))
+        return count
+
+    def _chapter_bytes(self, index):
+        name = self.engine.pages[index]
+        return self.engine.epub_archive.size(name) if name else 0
+
+    def _estimate_bytes_per_page(self):
+        counted = [(self._chapter_bytes(i), n) for i, n in self.page_counts.items()]
+        pages = sum(n for _, n in counted)
+        if pages:
+            return max(1.0, sum(b for b, _ in counted) / pages)
+        # Nothing laid out yet: guess from the page area, about two bytes
+        # of HTML per character.
+        family, size, width, height = self.params
+        return max(1.0, 2 * (width / (size * 0.7)) * (height / (size * 1.8)))
+
+    def first_page(self, index):
+        """Book-wide number of a chapter's first page, counting from 0."""
+        return sum(self.page_count(i) for i in range(index))
+
+    def total_pages(self):
+        return self.first_page(len(self.engine.pages))
+
+    def locate(self, page):
+        """(chapter, page in chapter) of a book-wide page number."""
+        for index in range(len(self.engine.pages)):
+            count = self.page_count(index)
+            if page < count:
+                return index, page
+            page -= count
+        last = len(self.engine.pages) - 1
+        return last, self.page_count(last) - 1
+
+    def position_at(self, index, page):
+        """Character offset of the first text on a page."""
+        hit = self.document(index).documentLayout().hitTest(
+            QPointF(EPUB_PAGE_MARGIN, page * self.page_height + EPUB_PAGE_MARGIN), Qt.FuzzyHit)
+        return max(0, hit)
+
+    def page_of(self, index, position):
+        """Page of a chapter that holds a character offset."""
+        doc = self.document(index)
+        block = doc.findBlock(position)
+        if not block.isValid():
+            return 0
+        y = doc.documentLayout().blockBoundingRect(block).y()
+        line = block.layout().lineForTextPosition(position - block.position())
+        if line.isValid():
+            y += line.y()
+        return min(doc.pageCount() - 1, int(y // self.page_height))
+
+    def anchor_position(self, index, name):
+        """Character offset of an id/name anchor in a chapter, or None."""
+        block = self.document(index).begin()
+        while block.isValid():
+            fragments = block.begin()
+            while not fragments.atEnd():
+                fragment = fragments.fragment()
+                if name in fragment.charFormat().anchorNames():
+                    return fragment.position()
+                fragments += 1
+            block = block.next()
+        return None
+
+    def find(self, index, text):
+        """(start, end) offsets of the first match of `text` in a chapter, or None."""
+        cursor = self.document(index).find(text)
+        return None if cursor.isNull() else (cursor.selectionStart(), cursor.selectionEnd())
 
 class RenderEngine:
-    def __init__(self):
+    def __init__(self, cache_budget=DEFAULT_CACHE_BUDGET, prefetch_workers=1, alpha=False, disk_cache=None):
         self.pdf_doc = None
-        self.epub_temp_dir = None
+        self.pdf_path = None
+        self.pdf_file = None
+        self.disk_cache = disk_cache
+        self._fingerprint = None
+        self._page_rects = None
+        self._image_rects = {}
+        self.night_mode = None
+        self.epub_archive = None
         self.pages = []  
         self.book_type = None
+        self.page_cache = LRUCache(cache_budget, lambda img: img.sizeInBytes())
+        self.chapter_cache = LRUCache(CHAPTER_CACHE_BUDGET, len)
+        self.resource_cache = LRUCache(RESOURCE_CACHE_BUDGET, len)
+        self.paginator = EpubPaginator(self)
+        # Values are (DisplayList, estimated bytes); see _estimate_display_list_bytes.
+        self.display_lists = LRUCache(DISPLAY_LIST_BUDGET, lambda entry: entry[1])
+        self.timings = {"parse": [0, 0.0], "rasterise": [0, 0.0], "qimage": [0, 0.0], "night": [0, 0.0]}
+        # Pages are opaque RGB unless a transparent background is asked for.
+        self.alpha = alpha
+
+        # Prefetch state: worker threads keep their own fitz handles and
+        # reopen them whenever doc_generation changes.
+        self.prefetch_workers = prefetch_workers
+        self._pdf_password = None
+        self._doc_generation = 0
+        self._prefetch_pool = None
+        self._prefetch_jobs = {}
+        self._prefetch_generation = 0
+        self._render_generation = 0
+        self._thread_state = threading.local()
+        self._thread_docs = []
+        self._thread_docs_lock = threading.Lock()
+
+    def _cache_key(self, index, zoom, layout):
+        # The night mode is read once here and travels with the job from then on.
+        return (index, round(zoom, 3), layout, self.night_mode)
 
     def cleanup(self):
-        """Clean up temp files and close documents."""
-        if self.epub_temp_dir and os.path.isdir(self.epub_temp_dir):
-            try:
-                shutil.rmtree(self.epub_temp_dir, ignore_errors=True)
-            except Exception:
-                pass
-        self.epub_temp_dir = None
+        """Close documents and drop cached pages."""
+        if self.epub_archive:
+            self.epub_archive.close()
+            self.epub_archive = None
+        self.chapter_cache.clear()
+        self.resource_cache.clear()
+        self.paginator.clear()
+        self._shutdown_prefetch()
+        self.page_cache.clear()
         if self.pdf_doc:
             self.pdf_doc.close()
             self.pdf_doc = None
+        if self.pdf_file:
+            self.pdf_file.close()
+            self.pdf_file = None
+        self.pdf_path = None
+        self._fingerprint = None
+        self._pdf_password = None
+        self._page_rects = None
+        self._image_rects = {}
+        self.pages = []
+        self.book_type = None
 
+    @perf.timed("load")
     def load_pdf(self, path, password_callback=None):
         self.cleanup()
         self.book_type = "pdf"
-        self.pdf_doc = fitz.open(path)
+        # Opened from a memory map: MuPDF reads objects straight from the
+        # mapped bytes, so only the pages that are shown are ever read in.
+        self.pdf_file = module.MappedFile(path)
+        self.pdf_file.will_need(self.pdf_file.size - PDF_TAIL_READAHEAD, PDF_TAIL_READAHEAD)
+        self.pdf_doc = fitz.open(stream=self.pdf_file.view, filetype="pdf")
         
         if getattr(self.pdf_doc, "needs_pass", False):
             if password_callback:
                 pw = password_callback()
                 if not pw or not self.pdf_doc.authenticate(pw):
                     self.pdf_doc.close()
+                    self.pdf_doc = None
                     raise ValueError("Password required or incorrect")
+                self._pdf_password = pw
             else:
                 self.pdf_doc.close()
+                self.pdf_doc = None
                 raise ValueError("Password required")
 
+        self.pdf_path = path
+        # Decrypted pages of protected files are never written to disk.
+        if self.disk_cache is not None and self._pdf_password is None:
+            self._fingerprint = module.file_fingerprint(path)
         self.pages = list(range(self.pdf_doc.page_count))
         return len(self.pages)
 
-    def load_epub(self, path):
+    @perf.timed("load")
+    def load_epub(self, path, progress=None, is_cancelled=None):
+        """Index the EPUB spine; `pages` holds one archive path per chapter.
+
+        Chapters are only read and rewritten when get_epub_html() first asks
+        for them. `progress(stage, done, total)` is called as spine entries
+        are indexed and `is_cancelled()` aborts the load with LoadCancelled.
+        """
         self.cleanup()
         self.book_type = "epub"
-        self.epub_temp_dir = tempfile.mkdtemp(prefix="fereader_epub_")
-        
-        book = epub.read_epub(path)
-        
-        for item in book.get_items():
-            content = item.get_content()
-            rel_path = item.file_name.replace("/", os.sep)
-            out_path = os.path.join(self.epub_temp_dir, rel_path)
-            os.makedirs(os.path.dirname(out_path), exist_ok=True)
-            with open(out_path, "wb") as f:
-                f.write(content)
-
-        # Process HTML
-        self.pages = []
-        for item in book.get_items_of_type(ebooklib.ITEM_DOCUMENT):
-            html_bytes = item.get_content()
-            html = html_bytes.decode("utf-8", errors="ignore")
-            html_dir = posixpath.dirname(item.file_name)
-            soup = BeautifulSoup(html, "html.parser")
-
-            for img_tag in soup.find_all("img"):
-                src = img_tag.get("src")
-                if src:
-                    rel = posixpath.normpath(posixpath.join(html_dir, src))
-                    local_path = os.path.join(self.epub_temp_dir, rel.replace("/", os.sep))
-                    file_url = QUrl.fromLocalFile(local_path).toString()
-                    img_tag["src"] = file_url
-            
-            self.pages.append(str(soup))
-        
-        if not self.pages:
-            self.pages.append("<h3>No readable content found.</h3>")
-        
+        self.epub_archive = module.EpubArchive(path)
+
+        spine = self.epub_archive.spine
+        pages = []
+        for done, name in enumerate(spine, 1):
+            self._check_cancelled(is_cancelled)
+            pages.append(name)
+            if progress: progress("chapters", done, len(spine))
+        self.pages = pages or [None]
         return self.pages
 
+    def get_epub_html(self, index):
+        """Return the HTML of a chapter, decoding it on first use.
+
+        Relative image and stylesheet links are left as-is; the view resolves
+        them through get_epub_resource().
+        """
+        if self.book_type != "epub" or not (0 <= index < len(self.pages)):
+            return ""
+        name = self.pages[index]
+        if name is None:
+            return "<h3>No readable content found.</h3>"
+        html = self.chapter_cache.get(name)
+        if html is None:
+            try:
+                html = self.epub_archive.read(name).decode("utf-8", errors="ignore")
+            except KeyError:
+                html = "<h3>Chapter not found.</h3>"
+            self.chapter_cache.put(name, html)
+        return html
+
+    def get_epub_resource(self, index, href):
+        """Return the bytes of a resource linked from chapter `index`, or None."""
+        if self.book_type != "epub" or not (0 <= index < len(self.pages)) or not self.pages[index]:
+            return None
+        name = posixpath.normpath(posixpath.join(posixpath.dirname(self.pages[index]), href))
+        data = self.resource_cache.get(name)
+        if data is None:
+            try:
+                data = self.epub_archive.read(name)
+            except KeyError:
+                return None
+            self.resource_cache.put(name, data)
+        return data
+
+    @staticmethod
+    def _check_cancelled(is_cancelled):
+        if is_cancelled and is_cancelled():
+            raise LoadCancelled()
+
     def get_pdf_page_pixmap(self, index, zoom=1.0):
         if not self.pdf_doc or not (0 <= index < self.pdf_doc.page_count):
             return None
+        if zoom < 0.1: zoom = 0.1
+        img = self._get_page_image(index, zoom)
+        return QPixmap.fromImage(img) if img is not None else None
+
+    def get_pdf_spread_pixmap(self, left_index, zoom=1.0):
+        """Render two pages side-by-side."""
+        if not self.pdf_doc or not (0 <= left_index < self.pdf_doc.page_count):
+            return None
+        if zoom < 0.1: zoom = 0.1
+        img = self._get_spread_image(left_index, zoom)
+        return QPixmap.fromImage(img) if img is not None else None
+
+    def get_pdf_image(self, index, zoom=1.0, spread=False):
+        """Render a page or spread to a QImage; usable without a GUI."""
+        if not self.pdf_doc or not (0 <= index < self.pdf_doc.page_count):
+            return None
+        if zoom < 0.1: zoom = 0.1
+        return self._get_spread_image(index, zoom) if spread else self._get_page_image(index, zoom)
+
+    def set_night_mode(self, enabled, keep_images=True):
+        """Render PDF pages dark: lightness inverted, hue kept. The transform
+        runs once per rendered page and the result is what gets cached.
+        Returns True if the mode changed and pages must be rendered again."""
+        mode = ("keep_images" if keep_images else "all") if enabled else None
+        if mode == self.night_mode:
+            return False
+        self.cancel_prefetch()
+        self.abort_render()
+        self.night_mode = mode
+        self.page_cache.clear()
+        return True
+
+    def get_pdf_page_size(self, index, zoom=1.0):
+        """Pixel size of a page rendered at `zoom`, without rendering it."""
+        if not self.pdf_doc or not (0 <= index < self.pdf_doc.page_count):
+            return (0, 0)
+        rect = self.pdf_doc.load_page(index).rect * fitz.Matrix(zoom, zoom)
+        return (rect.irect.width, rect.irect.height)
+
+    def get_page_rects(self):
+        """Unzoomed rect of every PDF page, computed once per document."""
+        if self._page_rects is None and self.pdf_doc:
+            self._page_rects = [self.pdf_doc.load_page(i).rect for i in range(self.pdf_doc.page_count)]
+        return self._page_rects or []
+
+    def get_search_rects(self, index, text):
+        """Unzoomed rects of every occurrence of the words of `text` on a page."""
+        if not self.pdf_doc or not (0 <= index < self.pdf_doc.page_count):
+            return []
+        page = self.pdf_doc.load_page(index)
+        rects = page.search_for(text)
+        if not rects:
+            for term in text.split():
+                rects.extend(page.search_for(term))
+        return rects
+
+    def get_pdf_tile_image(self, index, zoom, col, row):
+        """Render one TILE_SIZE square of a page at `zoom`.
+
+        Tiles are cached per zoom level, so at high zoom only the part of the
+        page that is actually on screen has to be rasterised.
+        """
+        if not self.pdf_doc or not (0 <= index < self.pdf_doc.page_count):
+            return None
+        return self._get_tile_image(index, zoom, col, row)
+
+    def get_cached_image(self, index, zoom=1.0, spread=False):
+        """Return the QImage of a page or spread from memory or disk, or None; never renders."""
+        if zoom < 0.1: zoom = 0.1
+        return self._cached_or_pending(self._cache_key(index, zoom, "spread" if spread else "page"), wait=False)
+
+    def get_cached_thumbnail(self, index):
+        """THUMBNAIL_WIDTH-wide image of a page saved by an earlier render, or None."""
+        return self._cached_or_pending(self._cache_key(index, 0, "thumb"), wait=False)
+
+    def render_async(self, index, zoom=1.0, spread=False):
+        """Render a page or spread on the worker pool.
+
+        Returns a Future resolving to the QImage, or to None if the render was
+        superseded by abort_render() or a later render_async() call.
+        """
+        if zoom < 0.1: zoom = 0.1
+        self.cancel_prefetch()
+        self._render_generation += 1
+        return self._pool().submit(self._render_job, index, zoom, spread, self._render_generation)
+
+    def abort_render(self):
+        """Make an in-flight render_async() job stop at its next band."""
+        self._render_generation += 1
+
+    def _render_job(self, index, zoom, spread, generation):
+        doc = self._thread_doc()
+        should_abort = lambda: generation != self._render_generation
+        if doc is None or should_abort():
+            return None
+        with perf.span("render", page=index, zoom=round(zoom, 3), spread=spread) as fields:
+            if spread:
+                img = self._get_spread_image(index, zoom, doc, should_abort)
+            else:
+                img = self._get_page_image(index, zoom, doc, should_abort)
+            fields["aborted"] = img is None
+        return img
+
+    def _get_tile_image(self, index, zoom, col, row, doc=None, should_abort=None):
+        key = self._cache_key(index, zoom, ("tile", col, row))
+        img = self._cached_or_pending(key, wait=doc is None)
+        if img is None:
+            img = self._render_page_image(index, zoom, doc or self.pdf_doc, key[3], (col, row), should_abort)
+            if img is not None:
+                self._store(key, img)
+        return img
+
+    def _get_page_image(self, index, zoom, doc=None, should_abort=None):
+        key = self._cache_key(index, zoom, "page")
+        img = self._cached_or_pending(key, wait=doc is None)
+        if img is None:
+            img = self._render_page_image(index, zoom, doc or self.pdf_doc, key[3], None, should_abort)
+            if img is not None:
+                self._store(key, img)
+        return img
+
+    def _get_spread_image(self, left_index, zoom, doc=None, should_abort=None):
+        key = self._cache_key(left_index, zoom, "spread")
+        img = self._cached_or_pending(key, wait=doc is None)
+        if img is not None:
+            return img
+
+        doc = doc or self.pdf_doc
+        if left_index + 1 >= doc.page_count:
+            return self._get_page_image(left_index, zoom, doc, should_abort)
+        img = self._render_spread_image(left_index, zoom, doc, key[3], should_abort)
+        if img is not None:
+            self._store(key, img)
+        return img
+
+    def _cached_or_pending(self, key, wait):
+        img = self.page_cache.get(key)
+        if img is None and wait:
+            # Rather than rasterising twice, wait for a prefetch already at work on it.
+            job = self._prefetch_jobs.get(key)
+            if job is not None and job.running():
+                job.result()
+                img = self.page_cache.get(key)
+        if img is None:
+            name = self._disk_name(key)
+            if name is not None:
+                img = self.disk_cache.get(name)
+                if img is not None:
+                    self.page_cache.put(key, img)
+        return img
+
+    def _store(self, key, img):
+        self.page_cache.put(key, img)
+        name = self._disk_name(key)
+        if name is None:
+            return
+        self.disk_cache.put(name, img)
+        index, _, layout, night = key
+        thumb = self._disk_name((index, 0, "thumb", night))
+        if layout == "page" and thumb not in self.disk_cache:
+            self.disk_cache.put(thumb, img.scaledToWidth(THUMBNAIL_WIDTH, Qt.SmoothTransformation))
+
+    def _disk_name(self, key):
+        """File name of a page, spread or thumbnail in the disk cache; tiles stay in memory."""
+        index, zoom, layout, night = key
+        if self._fingerprint is None or not isinstance(layout, str):
+            return None
+        # Zooms share a file per 1% bucket.
+        night = f"_{night}" if night else ""
+        return f"{self._fingerprint}_{index}_{zoom:.2f}_{layout}{night}.page"
+
+    def _get_display_list(self, index, doc):
+        """Interpret a page's content stream once; re-zooms only rasterise."""
+        entry = self.display_lists.get(index)
+        if entry is None:
+            start = time.perf_counter()
+            page = doc.load_page(index)
+            entry = (page.get_displaylist(), self._estimate_display_list_bytes(page))
+            self._record_timing("parse", start, page=index)
+            self.display_lists.put(index, entry)
+        return entry[0]
+
+    @staticmethod
+    def _estimate_display_list_bytes(page):
+        # MuPDF does not report display list sizes, so approximate from the
+        # compressed length of the page's content streams.
+        size = 64 * 1024
+        for xref in page.get_contents():
+            kind, value = page.parent.xref_get_key(xref, "Length")
+            if kind == "int":
+                size += 4 * int(value)
+        return size
+
+    def _record_timing(self, stage, start, **fields):
+        elapsed = time.perf_counter() - start
+        entry = self.timings[stage]
+        entry[0] += 1
+        entry[1] += elapsed
+        perf.emit(stage, elapsed * 1000, **fields)
+
+    def timing_stats(self):
+        """Average milliseconds spent interpreting, rasterising and wrapping pages."""
+        return {
+            stage: {"count": count, "avg_ms": total * 1000 / count if count else 0.0}
+            for stage, (count, total) in self.timings.items()
+        }
+
+    def _render_page_image(self, index, zoom, doc, night=None, tile=None, should_abort=None):
         try:
-            page = self.pdf_doc.load_page(index)
-            if zoom < 0.1: zoom = 0.1
+            dl = self._get_display_list(index, doc)
             mat = fitz.Matrix(zoom, zoom)
-            pix = page.get_pixmap(matrix=mat, alpha=True)
-            img = QImage(pix.samples, pix.width, pix.height, pix.stride, QImage.Format_RGBA8888)
-            return QPixmap.fromImage(img.copy())
+            clip = dl.rect
+            if tile is not None:
+                col, row = tile
+                x0, y0 = col * TILE_SIZE, row * TILE_SIZE
+                clip = fitz.Rect(x0, y0, x0 + TILE_SIZE, y0 + TILE_SIZE) * ~mat & dl.rect
+            start = time.perf_counter()
+            pix = self._rasterise(dl, mat, clip, self.alpha, should_abort)
+            if pix is None:
+                return None
+            self._record_timing("rasterise", start, page=index, zoom=round(zoom, 3), tile=tile)
+            if night:
+                self._apply_night_mode(pix, [(index, mat)], doc, night)
+            start = time.perf_counter()
+            img = self._to_qimage(pix)
+            self._record_timing("qimage", start, page=index)
+            return img
         except Exception as e:
             print(f"Render Error: {e}")
+            perf.emit("render_error", 0, page=index, error=str(e))
             return None
 
-    def get_pdf_spread_pixmap(self, left_index, zoom=1.0):
-        """Render two pages side-by-side."""
-        left_pix = self.get_pdf_page_pixmap(left_index, zoom)
-        if left_pix is None:
+    def _render_spread_image(self, left_index, zoom, doc, night=None, should_abort=None):
+        """Rasterise two pages side by side into one shared buffer.
+
+        Each page gets its own zoom so that both come out at the height of
+        the taller one, which avoids rescaling either afterwards.
+        """
+        try:
+            dls = [self._get_display_list(i, doc) for i in (left_index, left_index + 1)]
+            height = max(dl.rect.height for dl in dls) * zoom
+            start = time.perf_counter()
+            mupdf = fitz.mupdf
+            parts, x = [], 0
+            for dl in dls:
+                scale = height / dl.rect.height
+                mat = fitz.Matrix(scale, scale)
+                area = (dl.rect * mat).irect
+                mat = mat * fitz.Matrix(1, 0, 0, 1, x - area.x0, -area.y0)
+                parts.append((dl, mat, mupdf.FzIrect(x, 0, x + area.width, area.height)))
+                x += area.width
+            bbox = mupdf.FzIrect(0, 0, x, max(part[2].y1 for part in parts))
+            pix = self._new_target(bbox, self.alpha)
+            for dl, mat, part in parts:
+                if not self._draw_bands(dl, mat, pix, part, should_abort):
+                    return None
+            self._record_timing("rasterise", start, page=left_index, zoom=round(zoom, 3), spread=True)
+            pix = fitz.Pixmap("raw", pix)
+            if night:
+                self._apply_night_mode(pix, [(left_index + i, part[1]) for i, part in enumerate(parts)], doc, night)
+            start = time.perf_counter()
+            img = self._to_qimage(pix)
+            self._record_timing("qimage", start, page=left_index)
+            return img
+        except Exception as e:
+            print(f"Render Error: {e}")
+            perf.emit("render_error", 0, page=left_index, error=str(e))
             return None
-        
-        right_pix = None
-        if left_index + 1 < self.pdf_doc.page_count:
-            right_pix = self.get_pdf_page_pixmap(left_index + 1, zoom)
-        
-        if right_pix is None:
-            return left_pix
-
-        target_height = max(left_pix.height(), right_pix.height())
-        left_scaled = left_pix.scaledToHeight(target_height, Qt.SmoothTransformation)
-        right_scaled = right_pix.scaledToHeight(target_height, Qt.SmoothTransformation)
-
-        spread = QPixmap(left_scaled.width() + right_scaled.width(), target_height)
-        spread.fill(Qt.transparent)
-        painter = QPainter(spread)
-        painter.drawPixmap(0, 0, left_scaled)
-        painter.drawPixmap(left_scaled.width(), 0, right_scaled)
-        painter.end()
-        return spread
+
+    def _apply_night_mode(self, pix, pages, doc, night):
+        """Darken a freshly rasterised pixmap; `pages` holds the (index,
+        matrix) of every page drawn into it."""
+        start = time.perf_counter()
+        keep = []
+        if night == "keep_images":
+            keep = [(rect * mat).irect for index, mat in pages for rect in self._kept_images(index, doc)]
+        invert_lightness(pix, keep)
+        self._record_timing("night", start, page=pages[0][0], megapixels=round(pix.width * pix.height / 1e6, 2))
+
+    def _kept_images(self, index, doc):
+        """Rects of the pictures on a page that night mode leaves as they are."""
+        rects = self._image_rects.get(index)
+        if rects is None:
+            page = doc.load_page(index)
+            limit = PAGE_IMAGE_COVERAGE * abs(page.rect)
+            rects = [fitz.Rect(info["bbox"]) for info in page.get_image_info()]
+            rects = self._image_rects[index] = [r for r in rects if abs(r & page.rect) < limit]
+        return rects
+
+    @staticmethod
+    def _to_qimage(pix):
+        """Wrap a pixmap's samples in a QImage without copying them."""
+        fmt = QImage.Format_RGBA8888 if pix.alpha else QImage.Format_RGB888
+        img = QImage(pix.samples_mv, pix.width, pix.height, pix.stride, fmt)
+        # The QImage only borrows the samples, so it has to keep their owner alive.
+        img.fitz_pixmap = pix
+        return img
+
+    @staticmethod
+    def _rasterise(dl, mat, clip, alpha, should_abort=None):
+        """Rasterise `clip` of a display list into one pixmap, band by band.
+
+        Coming back to Python between bands lets the UI thread take the GIL
+        and lets a superseded render stop early, in which case None is
+        returned.
+        """
+        mupdf = fitz.mupdf
+        bbox = mupdf.fz_round_rect(mupdf.fz_transform_rect(mupdf.FzRect(*clip), mupdf.FzMatrix(*mat)))
+        pix = RenderEngine._new_target(bbox, alpha)
+        if not RenderEngine._draw_bands(dl, mat, pix, bbox, should_abort):
+            return None
+        return fitz.Pixmap("raw", pix)
+
+    @staticmethod
+    def _new_target(bbox, alpha):
+        mupdf = fitz.mupdf
+        pix = mupdf.fz_new_pixmap_with_bbox(
+            mupdf.FzColorspace(mupdf.FzColorspace.Fixed_RGB), bbox, mupdf.FzSeparations(), int(alpha))
+        if alpha:
+            mupdf.fz_clear_pixmap(pix)
+        else:
+            mupdf.fz_clear_pixmap_with_value(pix, 0xFF)
+        return pix
+
+    @staticmethod
+    def _draw_bands(dl, mat, pix, bbox, should_abort=None):
+        """Draw a display list into the `bbox` area of `pix`; False if aborted."""
+        mupdf = fitz.mupdf
+        ctm = mupdf.FzMatrix(*mat)
+        inverse = ~mat
+        # Bands always span the full pixmap width (MuPDF mis-offsets
+        # sub-pixmaps that start at a nonzero column), so a narrower area is
+        # kept in place with a clip instead.
+        clip = None
+        if bbox.x0 != pix.x() or bbox.x1 != pix.x() + pix.w():
+            clip = mupdf.fz_new_path()
+            mupdf.fz_rectto(clip, *(fitz.Rect(bbox.x0, bbox.y0, bbox.x1, bbox.y1) * inverse))
+        for y0 in range(bbox.y0, bbox.y1, RENDER_BAND_HEIGHT):
+            if should_abort and should_abort():
+                return False
+            y1 = min(y0 + RENDER_BAND_HEIGHT, bbox.y1)
+            band = mupdf.fz_new_pixmap_from_pixmap(pix, mupdf.FzIrect(pix.x(), y0, pix.x() + pix.w(), y1))
+            dev = mupdf.fz_new_draw_device(ctm, band)
+            if clip is not None:
+                mupdf.fz_clip_path(dev, clip, 0, mupdf.FzMatrix(), mupdf.FzRect(mupdf.FzRect.Fixed_INFINITE))
+            area = fitz.Rect(bbox.x0, y0, bbox.x1, y1) * inverse
+            mupdf.fz_run_display_list(dl.this, dev, mupdf.FzMatrix(), mupdf.FzRect(*area), mupdf.FzCookie())
+            if clip is not None:
+                mupdf.fz_pop_clip(dev)
+            mupdf.fz_close_device(dev)
+        return True
+
+    def prefetch(self, index, zoom=1.0, spread=False):
+        """Render the neighbours of `index` in the background.
+
+        Jobs for targets that are no longer neighbours are cancelled.
+        """
+        if not self.pdf_doc or self.prefetch_workers < 1:
+            return
+        if zoom < 0.1: zoom = 0.1
+        step = 2 if spread else 1
+        layout = "spread" if spread else "page"
+        targets = []
+        for distance in range(1, PREFETCH_DISTANCE + 1):
+            for target in (index + distance * step, index - distance * step):
+                if 0 <= target < self.pdf_doc.page_count:
+                    targets.append(self._cache_key(target, zoom, layout))
+        self._schedule_prefetch(targets)
+
+    def prefetch_tiles(self, index, zoom, tiles):
+        """Render the given (col, row) tiles of a page in the background."""
+        if not self.pdf_doc or self.prefetch_workers < 1:
+            return
+        self._schedule_prefetch([self._cache_key(index, zoom, ("tile", col, row)) for col, row in tiles])
+
+    def prefetch_pages(self, indices, zoom=1.0):
+        """Render the given pages in the background.
+
+        Returns {index: Future} for the pages that are not cached yet.
+        """
+        if not self.pdf_doc or self.prefetch_workers < 1:
+            return {}
+        if zoom < 0.1: zoom = 0.1
+        jobs = self._schedule_prefetch([self._cache_key(i, zoom, "page") for i in indices])
+        return {key[0]: job for key, job in jobs.items()}
+
+    def _schedule_prefetch(self, targets):
+        for key, job in list(self._prefetch_jobs.items()):
+            if key not in targets or job.done():
+                job.cancel()
+                self._prefetch_jobs.pop(key, None)
+
+        generation = self._prefetch_generation
+        jobs = {}
+        for key in targets:
+            if key in self.page_cache:
+                continue
+            if key not in self._prefetch_jobs:
+                self._prefetch_jobs[key] = self._pool().submit(self._prefetch_job, key, generation)
+            jobs[key] = self._prefetch_jobs[key]
+        return jobs
+
+    def _pool(self):
+        if self._prefetch_pool is None:
+            self._prefetch_pool = ThreadPoolExecutor(
+                max_workers=max(1, self.prefetch_workers), thread_name_prefix="fereader_render")
+        return self._prefetch_pool
+
+    def cancel_prefetch(self):
+        """Drop all pending prefetch jobs, e.g. after a jump or a zoom change."""
+        self._prefetch_generation += 1
+        for job in self._prefetch_jobs.values():
+            job.cancel()
+        self._prefetch_jobs.clear()
+
+    def _prefetch_job(self, key, generation):
+        should_abort = lambda: generation != self._prefetch_generation
+        if should_abort():
+            return
+        doc = self._thread_doc()
+        if doc is None:
+            return
+        index, zoom, layout, _ = key
+        if layout == "spread":
+            self._get_spread_image(index, zoom, doc, should_abort)
+        elif layout == "page":
+            self._get_page_image(index, zoom, doc, should_abort)
+        else:
+            self._get_tile_image(index, zoom, layout[1], layout[2], doc, should_abort)
+
+    def _thread_doc(self):
+        state = self._thread_state
+        if getattr(state, "generation", None) != self._doc_generation:
+            state.doc = None
+            state.generation = self._doc_generation
+            if self.pdf_file:
+                doc = fitz.open(stream=self.pdf_file.view, filetype="pdf")
+                if self._pdf_password:
+                    doc.authenticate(self._pdf_password)
+                with self._thread_docs_lock:
+                    self._thread_docs.append(doc)
+                state.doc = doc
+        return state.doc
+
+    def _shutdown_prefetch(self):
+        self.cancel_prefetch()
+        self.abort_render()
+        self._doc_generation += 1
+        if self._prefetch_pool is not None:
+            self._prefetch_pool.shutdown(wait=True, cancel_futures=True)
+            self._prefetch_pool = None
+        # Display lists may belong to worker handles, so drop them first.
+        self.display_lists.clear()
+        with self._thread_docs_lock:
+            for doc in self._thread_docs:
+                doc.close()
+            self._thread_docs.clear()
+
+    def cache_stats(self):
+        return self.page_cache.stats()
+
+    def memory_stats(self):
+        """Size of the open book's memory map and how much of it is resident."""
+        mapped = self.pdf_file or (self.epub_archive.file if self.epub_archive else None)
+        if mapped is None:
+            return {"mapped_bytes": 0, "resident_bytes": 0}
+        return {"mapped_bytes": mapped.size, "resident_bytes": mapped.resident_bytes()}
     
     def get_initial_zoom(self, view_width, view_height):
         if self.pdf_doc and self.pdf_doc.page_count > 0:
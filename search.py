@@ -0,0 +1,197 @@
+import os
+import re
+import sqlite3
+import threading
+from collections import namedtuple
+
+import module
+
+fitz = module.LazyModule("fitz")
+bs4 = module.LazyModule("bs4")
+
+INDEX_PATH = os.path.join(module.APP_DIR, "search_index.db")
+COMMIT_EVERY = 50
+
+SearchHit = namedtuple("SearchHit", "path page snippet")
+
+def _fts_query(terms):
+    # Quote every term so user input can never be read as FTS syntax.
+    return " ".join('"%s"' % term.replace('"', '""') for term in terms)
+
+def _like_pattern(term):
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+class SearchIndex:
+    """Full-text index of page/chapter text in a sidecar SQLite FTS5 file.
+
+    Books are keyed by content fingerprint; a path's mtime and size are
+    kept so reopening an unchanged book costs a single row lookup. Each
+    thread gets its own connection, so the indexer can write while the UI
+    queries.
+    """
+    def __init__(self, db_path=INDEX_PATH):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._init_schema()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def _init_schema(self):
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS books ("
+            "fingerprint TEXT PRIMARY KEY, path TEXT, mtime REAL, size INTEGER, "
+            "page_count INTEGER, indexed INTEGER)")
+        conn.execute("CREATE INDEX IF NOT EXISTS books_path ON books(path)")
+        try:
+            # Trigram tokens match inside words, which scripts written without
+            # spaces (Thai) need.
+            conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS page_text USING "
+                "fts5(text, fingerprint UNINDEXED, page UNINDEXED, tokenize='trigram')")
+        except sqlite3.OperationalError:
+            conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS page_text USING "
+                "fts5(text, fingerprint UNINDEXED, page UNINDEXED)")
+        conn.commit()
+        row = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'page_text'").fetchone()
+        self.trigram = "trigram" in row[0]
+
+    def close(self):
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+        self._local = threading.local()
+
+    def is_indexed(self, path):
+        """True if `path` is fully indexed and unchanged since."""
+        st = os.stat(path)
+        row = self._conn().execute(
+            "SELECT page_count, indexed FROM books WHERE path = ? AND mtime = ? AND size = ?",
+            (path, st.st_mtime, st.st_size)).fetchone()
+        return row is not None and row[0] is not None and row[1] >= row[0]
+
+    def index_document(self, path, progress=None, is_cancelled=None):
+        """Extract and store the text of a PDF or EPUB, resuming where a
+        previous run stopped. Returns False if nothing had to be extracted.
+        """
+        if self.is_indexed(path):
+            return False
+        conn = self._conn()
+        st = os.stat(path)
+        fingerprint = module.file_fingerprint(path)
+        row = conn.execute("SELECT indexed FROM books WHERE fingerprint = ?", (fingerprint,)).fetchone()
+        if row is None:
+            # A changed file leaves its old text behind under the old fingerprint.
+            for (stale,) in conn.execute("SELECT fingerprint FROM books WHERE path = ?", (path,)).fetchall():
+                conn.execute("DELETE FROM page_text WHERE fingerprint = ?", (stale,))
+                conn.execute("DELETE FROM books WHERE fingerprint = ?", (stale,))
+            conn.execute("INSERT INTO books VALUES (?, ?, ?, ?, NULL, 0)", (fingerprint, path, st.st_mtime, st.st_size))
+            start = 0
+        else:
+            # Same content, possibly touched or moved: keep the text.
+            conn.execute("UPDATE books SET path = ?, mtime = ?, size = ? WHERE fingerprint = ?",
+                         (path, st.st_mtime, st.st_size, fingerprint))
+            start = row[0]
+        conn.commit()
+
+        ext = os.path.splitext(path)[1].lower()
+        pages = self._iter_pdf_text(path, start) if ext == ".pdf" else self._iter_epub_text(path, start)
+        page_count = next(pages)
+        conn.execute("UPDATE books SET page_count = ? WHERE fingerprint = ?", (page_count, fingerprint))
+        done = start
+        try:
+            for index, text in pages:
+                if is_cancelled and is_cancelled():
+                    break
+                conn.execute("INSERT INTO page_text (text, fingerprint, page) VALUES (?, ?, ?)",
+                             (text, fingerprint, index))
+                done = index + 1
+                if done % COMMIT_EVERY == 0:
+                    conn.execute("UPDATE books SET indexed = ? WHERE fingerprint = ?", (done, fingerprint))
+                    conn.commit()
+                    if progress:
+                        progress(done, page_count)
+        finally:
+            pages.close()
+            conn.execute("UPDATE books SET indexed = ? WHERE fingerprint = ?", (done, fingerprint))
+            conn.commit()
+        if progress:
+            progress(done, page_count)
+        return True
+
+    @staticmethod
+    def _iter_pdf_text(path, start):
+        doc = fitz.open(path)
+        try:
+            yield doc.page_count
+            for index in range(start, doc.page_count):
+                yield index, doc.load_page(index).get_text()
+        finally:
+            doc.close()
+
+    @staticmethod
+    def _iter_epub_text(path, start):
+        archive = module.EpubArchive(path)
+        try:
+            yield len(archive.spine)
+            for index in range(start, len(archive.spine)):
+                html = archive.read(archive.spine[index]).decode("utf-8", errors="ignore")
+                yield index, bs4.BeautifulSoup(html, "html.parser").get_text(" ", strip=True)
+        finally:
+            archive.close()
+
+    def search(self, text, path=None, limit=200):
+        """Page hits for `text`, in one book or across all indexed books."""
+        terms = text.split()
+        if not terms:
+            return []
+        # Trigrams cannot match terms under three characters; those are
+        # checked with LIKE on the rows the longer terms select.
+        short = [term for term in terms if self.trigram and len(term) < 3]
+        matched = [term for term in terms if term not in short]
+        # Pick the hits first, then cut snippets for just those rows.
+        sql = ("SELECT page_text.rowid, books.path, page_text.page"
+               " FROM page_text JOIN books ON books.fingerprint = page_text.fingerprint WHERE 1")
+        args = []
+        if matched:
+            sql += " AND page_text MATCH ?"
+            args.append(_fts_query(matched))
+        for term in short:
+            sql += " AND page_text.text LIKE ? ESCAPE '\\'"
+            args.append(_like_pattern(term))
+        if path is not None:
+            sql += " AND books.path = ?"
+            args.append(path)
+        sql += " ORDER BY books.path, page_text.page LIMIT ?"
+        args.append(limit)
+        try:
+            conn = self._conn()
+            rows = conn.execute(sql, args).fetchall()
+            if not rows:
+                return []
+            # The text around the first term. FTS5's snippet() scores every
+            # match in the row, ~150 ms for a long chapter full of hits.
+            ids = ", ".join(str(row[0]) for row in rows)
+            windows = dict(conn.execute(
+                "SELECT rowid, substr(text, max(1, instr(lower(text), ?) - 30), 80) FROM page_text"
+                f" WHERE rowid IN ({ids})", (terms[0].lower(),)).fetchall())
+        except sqlite3.OperationalError as e:
+            print(f"Search Error: {e}")
+            return []
+        found = re.compile("|".join(re.escape(term) for term in sorted(terms, key=len, reverse=True)), re.IGNORECASE)
+        return [SearchHit(path, page, "..." + found.sub(lambda m: f"[{m.group(0)}]", windows.get(rowid, "")) + "...")
+                for rowid, path, page in rows]
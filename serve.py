@@ -0,0 +1,279 @@
+"""Headless page rendering over localhost HTTP or a Unix socket.
+
+    python -m serve --root library/ -j 4
+    curl "http://127.0.0.1:8765/render?file=manual.pdf&page=0&zoom=2" -o page.png
+
+    GET /info?file=F                  page count and page sizes in points
+    GET /render?file=F&page=N&zoom=Z  PNG of page N (0-based); spread=1 adds
+                                      page N+1 beside it, format=jpeg is smaller
+    GET /metrics                      latency, queue depth and cache counters
+
+Files are named relative to --root and must lie inside it. Pages are
+rendered by worker processes, each keeping its recently used documents
+open. Finished results are cached once, in the server process, keyed by
+the file's size and mtime so an edited file is rendered afresh.
+"""
+import sys
+import os
+import json
+import time
+import threading
+import argparse
+import socketserver
+import multiprocessing
+from collections import Counter, OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+from concurrent.futures import ProcessPoolExecutor
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PySide6.QtCore import QByteArray, QBuffer, QIODevice
+
+import module
+import perf
+import render
+
+DEFAULT_PORT = 8765
+RESULT_CACHE_BUDGET = 256 * 1024 * 1024
+HANDLES_PER_WORKER = 8
+MAX_ZOOM = 8.0
+JPEG_QUALITY = 85
+FORMATS = {"png": ("PNG", "image/png"), "jpeg": ("JPEG", "image/jpeg")}
+# Exceptions raised while handling a request, as HTTP status codes.
+ERROR_STATUS = ((FileNotFoundError, 404), (LookupError, 404), (PermissionError, 403), (ValueError, 400))
+
+# Worker process state: the Qt application and open engines, most recent last.
+_app = None
+_engines = OrderedDict()
+
+def _worker_init():
+    global _app
+    from PySide6.QtGui import QGuiApplication
+    _app = QGuiApplication.instance() or QGuiApplication([])
+
+def _ready():
+    return os.getpid()
+
+def _engine(path, stamp):
+    key = (path, stamp)
+    engine = _engines.pop(key, None)
+    if engine is None:
+        # The file changed: its old handle must not outlive it.
+        for old in [k for k in _engines if k[0] == path]:
+            _engines.pop(old).cleanup()
+        while len(_engines) >= HANDLES_PER_WORKER:
+            _engines.popitem(last=False)[1].cleanup()
+        # Encoded results are cached by the server, so no page cache here.
+        engine = render.RenderEngine(cache_budget=0)
+        engine.load_pdf(path)
+    _engines[key] = engine
+    return engine
+
+def _render_task(engine, page, zoom, spread, fmt):
+    if not 0 <= page < len(engine.pages):
+        raise IndexError(f"Page {page} out of range (0-{len(engine.pages) - 1})")
+    img = engine.get_pdf_image(page, zoom, spread)
+    if img is None:
+        raise RuntimeError(f"Page {page} could not be rendered")
+    data = QByteArray()
+    buffer = QBuffer(data)
+    buffer.open(QIODevice.WriteOnly)
+    img.save(buffer, FORMATS[fmt][0], JPEG_QUALITY if fmt == "jpeg" else -1)
+    return bytes(data)
+
+def _info_task(engine):
+    sizes = [[round(rect.width, 2), round(rect.height, 2)] for rect in engine.get_page_rects()]
+    return json.dumps({"pages": len(sizes), "sizes": sizes}).encode()
+
+def _run(task, path, stamp, *args):
+    """Worker entry point; returns the result and when work on it started."""
+    started = time.time()
+    try:
+        return task(_engine(path, stamp), *args), started
+    # Only plain exceptions pickle back reliably; MuPDF's do not.
+    except FileNotFoundError as e:
+        raise FileNotFoundError(str(e)) from None
+    except (ValueError, IndexError) as e:
+        raise ValueError(str(e)) from None
+    except Exception as e:
+        raise RuntimeError(f"{type(e).__name__}: {e}") from None
+
+def _percentile(values, q):
+    return values[min(len(values) - 1, int(q * len(values)))] if values else None
+
+class RenderService:
+    """Sends requests to the worker pool and keeps their results."""
+    def __init__(self, root, workers, cache_budget=RESULT_CACHE_BUDGET):
+        self.root = os.path.realpath(root)
+        self.workers = workers
+        # Spawned, not forked: the server already runs request threads.
+        self.pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                        initializer=_worker_init)
+        self.results = render.LRUCache(cache_budget, len)
+        self.trace = perf.RingBufferSink()
+        perf.add_sink(self.trace)
+        self.statuses = Counter()
+        self.queue_peak = 0
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start every worker now rather than on the first requests."""
+        for future in [self.pool.submit(_ready) for _ in range(self.workers)]:
+            future.result()
+
+    def close(self):
+        perf.remove_sink(self.trace)
+        self.pool.shutdown(cancel_futures=True)
+
+    def _resolve(self, name):
+        if not name:
+            raise ValueError("Missing file parameter")
+        path = os.path.realpath(os.path.join(self.root, name))
+        if os.path.commonpath([path, self.root]) != self.root:
+            raise PermissionError(f"{name} is outside the served directory")
+        if not path.lower().endswith(".pdf"):
+            raise ValueError("Only PDF files can be rendered")
+        st = os.stat(path)
+        return path, (st.st_size, st.st_mtime_ns)
+
+    def _call(self, key, fields, task, path, stamp, *args):
+        """A result from the cache, from a request already at work on it, or
+        from a worker."""
+        result = self.results.get(key)
+        if result is not None:
+            fields["cache"] = "hit"
+            return result
+        with self._lock:
+            future = self._pending.get(key)
+            fields["cache"] = "joined" if future else "miss"
+            if future is None:
+                future = self._pending[key] = self.pool.submit(_run, task, path, stamp, *args)
+                future.submitted = time.time()
+                self.queue_peak = max(self.queue_peak, len(self._pending) - self.workers)
+        if fields["cache"] == "miss":
+            # Outside the lock: the callback runs at once if the task is already done.
+            future.add_done_callback(lambda f: self._finished(key, f))
+        result, started = future.result()
+        fields["wait_ms"] = round(max(0.0, started - future.submitted) * 1000, 3)
+        return result
+
+    def _finished(self, key, future):
+        if not future.cancelled() and future.exception() is None:
+            self.results.put(key, future.result()[0])
+        with self._lock:
+            self._pending.pop(key, None)
+
+    def handle(self, route, query, fields):
+        """Return (content type, body) for a GET request."""
+        if route == "/metrics":
+            return "application/json", json.dumps(self.metrics(), indent=2).encode()
+        if route not in ("/info", "/render"):
+            raise LookupError(f"No such endpoint: {route}")
+        path, stamp = self._resolve(query.get("file"))
+        if route == "/info":
+            return "application/json", self._call((path, stamp, "info"), fields, _info_task, path, stamp)
+        page = int(query.get("page", 0))
+        zoom = round(float(query.get("zoom", 1.0)), 3)
+        if not 0.1 <= zoom <= MAX_ZOOM:
+            raise ValueError(f"Zoom must be between 0.1 and {MAX_ZOOM:g}")
+        spread = query.get("spread", "0") not in ("0", "false", "")
+        fmt = query.get("format", "png").lower().replace("jpg", "jpeg")
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown format: {fmt}")
+        fields.update(page=page, zoom=zoom)
+        key = (path, stamp, page, zoom, spread, fmt)
+        return FORMATS[fmt][1], self._call(key, fields, _render_task, path, stamp, page, zoom, spread, fmt)
+
+    def metrics(self):
+        """Latency and queue wait per endpoint over the recent requests, plus
+        current and peak queue depth and result cache counters."""
+        by_route = {}
+        for record in list(self.trace.records):
+            if record["name"] == "serve":
+                by_route.setdefault(record["route"], []).append(record)
+        latency = {}
+        for route, records in sorted(by_route.items()):
+            ms = sorted(r["ms"] for r in records)
+            waits = sorted(r["wait_ms"] for r in records if "wait_ms" in r)
+            latency[route] = {"count": len(ms), "p50_ms": _percentile(ms, 0.5), "p95_ms": _percentile(ms, 0.95),
+                              "max_ms": ms[-1], "queue_wait_p95_ms": _percentile(waits, 0.95),
+                              "cache_hits": sum(r.get("cache") == "hit" for r in records)}
+        with self._lock:
+            in_flight = len(self._pending)
+        return {"workers": self.workers, "in_flight": in_flight, "queue_depth": max(0, in_flight - self.workers),
+                "queue_depth_peak": self.queue_peak, "statuses": dict(self.statuses),
+                "latency": latency, "result_cache": self.results.stats()}
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = f"FeReader/{module.APP_VERSION}"
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        with perf.span("serve", route=url.path) as fields:
+            try:
+                content_type, body = self.server.service.handle(url.path, query, fields)
+                status = 200
+            except Exception as e:
+                status = next((code for kind, code in ERROR_STATUS if isinstance(e, kind)), 500)
+                content_type, body = "application/json", json.dumps({"error": str(e)}).encode()
+            fields["status"] = status
+        self.server.service.statuses[status] += 1
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        if "cache" in fields:
+            self.send_header("X-Cache", fields["cache"])
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Requests are counted in /metrics instead.
+        pass
+
+if hasattr(socketserver, "UnixStreamServer"):
+    class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m serve", description="Render PDF pages over HTTP without the UI.")
+    parser.add_argument("--root", default=".", help="directory the served files are named relative to")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="TCP port to listen on")
+    parser.add_argument("--socket", help="listen on this Unix socket instead of TCP")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="worker processes")
+    parser.add_argument("--cache-mb", type=int, default=RESULT_CACHE_BUDGET // 2 ** 20, help="result cache size")
+    args = parser.parse_args(argv)
+
+    if args.socket:
+        if not hasattr(socketserver, "UnixStreamServer"):
+            parser.error("Unix sockets are not available on this platform")
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+        server = UnixHTTPServer(args.socket, _Handler)
+        where = args.socket
+    else:
+        server = ThreadingHTTPServer((args.host, args.port), _Handler)
+        where = f"http://{args.host}:{server.server_address[1]}"
+    trace_path = os.environ.get("FEREADER_TRACE")
+    if trace_path:
+        perf.add_sink(perf.JsonLinesSink(trace_path))
+    server.service = RenderService(args.root, max(1, args.jobs), args.cache_mb * 2 ** 20)
+    try:
+        server.service.start()
+        print(f"Serving {server.service.root} on {where} with {server.service.workers} workers", flush=True)
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.service.close()
+        if args.socket and os.path.exists(args.socket):
+            os.remove(args.socket)
+    return 0
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
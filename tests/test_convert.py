@@ -0,0 +1,49 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import convert
+from convert import plan_jobs
+
+def _touch(*paths):
+    for path in paths:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        open(path, "w").close()
+
+def _plan(mode, *patterns):
+    return sorted((sources, output.replace(os.sep, "/")) for sources, output in plan_jobs(mode, patterns, "out"))
+
+def test_directory_with_and_without_trailing_slash(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    _touch("imgs/1.png", "imgs/2.png", "imgs/sub/3.png", "tx/a.txt", "tx/sub/b.txt")
+    images = [([os.path.join("imgs", "1.png"), os.path.join("imgs", "2.png")], "out/imgs.pdf"),
+              ([os.path.join("imgs", "sub", "3.png")], "out/imgs/sub.pdf")]
+    assert _plan("images_pdf", "imgs") == images
+    assert _plan("images_pdf", "imgs/") == images
+    texts = [([os.path.join("tx", "a.txt")], "out/a.pdf"), ([os.path.join("tx", "sub", "b.txt")], "out/sub/b.pdf")]
+    assert _plan("text_pdf", "tx") == texts
+    assert _plan("text_pdf", "tx/") == texts
+
+def test_recursive_glob_plans_each_file_once(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    _touch("imgs/1.png", "imgs/sub/2.png", "tx/a.txt", "tx/sub/b.txt")
+    assert _plan("text_epub", "tx/**") == [([os.path.join("tx", "a.txt")], "out/a.epub"),
+                                           ([os.path.join("tx", "sub", "b.txt")], "out/sub/b.epub")]
+    assert _plan("images_pdf", "imgs/**") == [([os.path.join("imgs", "1.png")], "out/imgs.pdf"),
+                                              ([os.path.join("imgs", "sub", "2.png")], "out/imgs/sub.pdf")]
+
+def test_globbed_files_keep_their_directories(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    _touch("in/a/notes.txt", "in/b/notes.txt")
+    assert _plan("text_pdf", "in/*/*.txt") == [([os.path.join("in", "a", "notes.txt")], "out/a/notes.pdf"),
+                                               ([os.path.join("in", "b", "notes.txt")], "out/b/notes.pdf")]
+
+def test_inputs_that_clash_are_reported(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    _touch("a/notes.txt", "b/notes.txt")
+    assert _plan("text_pdf", "a/*.txt", "b/*.txt") == [
+        ([os.path.join("a", "notes.txt"), os.path.join("b", "notes.txt")], "out/notes.pdf")]
+    assert convert.main(["text_pdf", "a/*.txt", "b/*.txt", "-o", "out", "-j", "1"]) == 1
+    assert "written by 2 inputs" in capsys.readouterr().out
+    assert not os.path.exists(os.path.join("out", "notes.pdf"))
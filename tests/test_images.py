@@ -0,0 +1,28 @@
+import os
+import sys
+import struct
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz
+
+from module import ConverterLogic
+
+def _rgba_png(width, height, pixel):
+    def chunk(kind, body):
+        return struct.pack(">I", len(body)) + kind + body + struct.pack(">I", zlib.crc32(kind + body))
+    rows = b"".join(b"\0" + bytes(pixel) * width for _ in range(height))
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(rows)) + chunk(b"IEND", b""))
+
+def test_translucent_png_is_not_darkened(tmp_path):
+    image = tmp_path / "half_blue.png"
+    image.write_bytes(_rgba_png(8, 8, (0, 0, 255, 128)))
+    output = str(tmp_path / "out.pdf")
+    ConverterLogic.images_to_pdf([str(image)], output, workers=1)
+    with fitz.open(output) as doc:
+        pix = doc[0].get_pixmap()
+    # Half-opaque blue over white paper.
+    r, g, b = pix.pixel(pix.width // 2, pix.height // 2)
+    assert abs(r - 127) <= 2 and abs(g - 127) <= 2 and b >= 253